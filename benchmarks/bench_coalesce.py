@@ -0,0 +1,120 @@
+"""Measure database load when many chats search the same title at once.
+
+Seeds the in-memory stand-in with synthetic release names, then fires bursts
+of concurrent ``search_files`` + ``search_facets`` calls for a few popular
+titles with the search cache empty, the way a release drop hits the bot.
+The same bursts run with and without the single-flight layer; the report
+shows database round trips and caller latency for each.
+
+    python benchmarks/bench_coalesce.py --callers 200 --titles 3 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_search import WORDS, synthetic_name  # noqa: E402
+from memory_mongo import InMemoryCollection  # noqa: E402
+
+
+class CountingCollection(InMemoryCollection):
+    """In-memory collection that counts its simulated round trips"""
+
+    def __init__(self, latency: float):
+        super().__init__(latency)
+        self.roundtrips = 0
+
+    async def _roundtrip(self):
+        self.roundtrips += 1
+        await super()._roundtrip()
+
+
+class NoFlight:
+    """Pass-through used to measure the bot without coalescing"""
+
+    async def do(self, key, factory):
+        return await factory()
+
+    def is_current(self, key) -> bool:
+        return True
+
+    def forget(self, predicate) -> int:
+        return 0
+
+
+async def seed(database, files: int, seed: int):
+    rng = random.Random(seed)
+    frequency = Counter()
+    for n in range(files):
+        doc = database.file_document(-100, f"file{n}", synthetic_name(rng), "video", file_unique_id=f"u{n}")
+        database.col_files.docs.append(doc)
+        frequency.update(doc["tokens"])
+    database.col_tokens.docs.extend({"_id": token, "df": df} for token, df in frequency.items())
+
+
+async def burst(database, titles: list, callers: int, arrival_spread: float) -> dict:
+    database.search_cache.clear()
+    database.col_files.roundtrips = database.col_tokens.roundtrips = 0
+    latencies = []
+
+    async def caller(n: int):
+        await asyncio.sleep(random.random() * arrival_spread)
+        start = time.perf_counter()
+        query = titles[n % len(titles)]
+        await database.search_files(query, 200)
+        await database.search_facets(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller(n) for n in range(callers)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "roundtrips": database.col_files.roundtrips + database.col_tokens.roundtrips,
+        "elapsed_s": elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--callers", type=int, default=200, help="concurrent searches in one burst")
+    parser.add_argument("--titles", type=int, default=3, help="distinct popular titles in the burst")
+    parser.add_argument("--spread", type=float, default=0.05, help="seconds over which callers arrive")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated database round trip (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # config.py reads these at import time; nothing connects to them
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ.setdefault("DATABASE_NAME", "AutoFilterBotBench")
+    import database
+
+    database.col_files = CountingCollection(args.latency)
+    database.col_tokens = CountingCollection(args.latency)
+    await seed(database, args.files, args.seed)
+
+    rng = random.Random(args.seed + 1)
+    titles = [" ".join(rng.sample(WORDS, 2)) for _ in range(args.titles)]
+    flights = database.search_flights
+    for name, layer in (("no coalescing", NoFlight()), ("single-flight", flights)):
+        database.search_flights = layer
+        result = await burst(database, titles, args.callers, args.spread)
+        print(
+            f"{name:>14}: {result['roundtrips']:>5} DB round trips, "
+            f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, {result['elapsed_s']:.2f}s"
+        )
+    print(f"single-flight stats: {flights.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
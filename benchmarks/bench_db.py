@@ -0,0 +1,133 @@
+"""Latency/throughput benchmark for the async MongoDB data layer.
+
+Simulates many groups sending messages at once: every request performs the
+two lookups ``auto_filter`` does (a manual filter ``find_one`` and a file
+search) and records its end-to-end latency. The same workload is run through
+a blocking driver called from the event loop (the old behaviour) and through
+the async driver.
+
+    python benchmarks/bench_db.py --memory --latency 0.005
+    python benchmarks/bench_db.py --uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from memory_mongo import InMemoryDatabase  # noqa: E402
+
+
+class BlockingCollection:
+    """Expose a synchronous pymongo collection through the async call shape."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return self._collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        cursor = self._collection.find(*args, **kwargs)
+
+        class _Cursor:
+            async def to_list(self, length=None):
+                return list(cursor.limit(length or 0))
+
+        return _Cursor()
+
+    async def insert_many(self, docs):
+        return self._collection.insert_many(docs)
+
+    async def delete_many(self, query):
+        return self._collection.delete_many(query)
+
+
+def open_databases(args):
+    if args.memory:
+        return (
+            InMemoryDatabase(latency=args.latency, blocking=True),
+            InMemoryDatabase(latency=args.latency, blocking=False),
+        )
+    from pymongo import AsyncMongoClient, MongoClient
+
+    sync_db = MongoClient(args.uri, maxPoolSize=args.pool)[args.database]
+    async_db = AsyncMongoClient(args.uri, maxPoolSize=args.pool)[args.database]
+
+    class _SyncDatabase:
+        def __getitem__(self, name):
+            return BlockingCollection(sync_db[name])
+
+    return _SyncDatabase(), async_db
+
+
+async def seed(db, chats: int):
+    await db["bench_filters"].delete_many({})
+    await db["bench_files"].delete_many({})
+    await db["bench_filters"].insert_many(
+        [{"chat_id": c, "keyword": f"kw{c}", "file_id": f"f{c}"} for c in range(chats)]
+    )
+    await db["bench_files"].insert_many(
+        [{"chat_id": i % chats, "file_name": f"Movie.{i}.1080p.mkv", "quality": "1080p"} for i in range(chats * 10)]
+    )
+
+
+async def handle(db, chat_id: int, arrival: float, latencies: list):
+    await db["bench_filters"].find_one({"chat_id": chat_id, "keyword": "missing"})
+    await db["bench_files"].find({"chat_id": chat_id}).to_list(50)
+    latencies.append(time.perf_counter() - arrival)
+
+
+async def run(db, chats: int, requests: int, interval: float) -> dict:
+    """Every group sends one message per ``interval``; latency is measured
+    from the message's arrival, so time spent queued behind a blocked loop
+    counts against it."""
+    latencies: list = []
+    start = time.perf_counter()
+
+    async def group(chat_id: int):
+        for n in range(requests):
+            arrival = start + n * interval
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            await handle(db, chat_id, arrival, latencies)
+
+    await asyncio.gather(*(group(c) for c in range(chats)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="AutoFilterBotBench")
+    parser.add_argument("--memory", action="store_true", help="use the in-memory stand-in instead of mongod")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated round trip for --memory (seconds)")
+    parser.add_argument("--pool", type=int, default=50, help="driver connection pool size")
+    parser.add_argument("--chats", type=int, default=50, help="concurrent groups")
+    parser.add_argument("--requests", type=int, default=20, help="messages per group")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between messages of one group")
+    args = parser.parse_args()
+
+    blocking_db, async_db = open_databases(args)
+    for name, db in (("blocking", blocking_db), ("async", async_db)):
+        await seed(db, args.chats)
+        result = await run(db, args.chats, args.requests, args.interval)
+        print(
+            f"{name:>8}: {result['requests']} requests in {result['elapsed_s']:.2f}s "
+            f"({result['throughput_rps']:.0f} req/s) "
+            f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""Compare the token-index search planner with the old unanchored regex scan.
+
+Builds a synthetic corpus of release-style file names in a scratch database
+on a local mongod, then runs the same queries through both paths and reports
+latency and documents examined. Finally times typo-tolerant lookups
+(``correct_query`` plus the corrected search) for misspelled queries.
+
+    python benchmarks/bench_search.py --files 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    "avengers endgame infinity war iron man spider home far from no way dark knight rises "
+    "batman begins inception interstellar tenet dunkirk matrix reloaded revolutions resurrections "
+    "john wick chapter parabellum mission impossible fallout dead reckoning fast furious hobbs "
+    "shaw jurassic world dominion park lost kingdom fallen star trek beyond into darkness wars "
+    "empire strikes back return jedi force awakens last rise skywalker rogue one solo mandalorian "
+    "breaking bad better call saul stranger things money heist squid game peaky blinders witcher"
+).split()
+YEARS = [str(y) for y in range(1990, 2025)]
+QUALITIES = ["480p", "540p", "720p", "1080p", "2160p"]
+SOURCES = ["BluRay", "WEB-DL", "WEBRip", "HDRip", "HDTV", "DVDRip"]
+CODECS = ["x264", "x265", "HEVC", "AVC"]
+LANGUAGES = ["Hindi", "English", "Tamil", "Telugu", "Dual.Audio", "Multi"]
+
+
+def synthetic_name(rng: random.Random) -> str:
+    title = ".".join(w.title() for w in rng.sample(WORDS, rng.randint(1, 4)))
+    return (
+        f"[www.Site{rng.randint(1, 50)}.com] {title}.{rng.choice(YEARS)}.{rng.choice(QUALITIES)}."
+        f"{rng.choice(SOURCES)}.{rng.choice(CODECS)}.{rng.choice(LANGUAGES)}-@Chan{rng.randint(1, 200)}.mkv"
+    )
+
+
+async def build_corpus(database, schema, files: int, seed: int):
+    from search import tokenize
+    from collections import Counter
+
+    await database.col_files.drop()
+    await database.col_tokens.drop()
+    await schema.ensure_indexes()
+
+    rng = random.Random(seed)
+    batch_size = 10000
+    start = time.perf_counter()
+    for offset in range(0, files, batch_size):
+        docs = []
+        frequency = Counter()
+        for _ in range(min(batch_size, files - offset)):
+            name = synthetic_name(rng)
+            tokens = tokenize(name)
+            frequency.update(tokens)
+            docs.append({"file_name": name, "file_id": "x", "quality": "Unknown", "tokens": tokens})
+        await database.col_files.insert_many(docs, ordered=False)
+        await database.update_token_stats(frequency)
+    print(f"corpus: {files} files built in {time.perf_counter() - start:.1f}s")
+
+
+async def measure(name, run_query, queries, database):
+    latencies = []
+    examined = []
+    for query in queries:
+        start = time.perf_counter()
+        plan = await run_query(query)
+        if plan is not None:
+            await database.col_files.find(plan).to_list(50)
+        latencies.append(time.perf_counter() - start)
+        if plan is not None:
+            explain = await database.col_files.find(plan).limit(50).explain()
+            examined.append(explain["executionStats"]["totalDocsExamined"])
+        else:
+            examined.append(0)
+    latencies.sort()
+    print(
+        f"{name:>6}: p50={statistics.median(latencies) * 1000:.1f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms "
+        f"docs examined (mean)={statistics.mean(examined):.0f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="AutoFilterBotBench")
+    parser.add_argument("--files", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reuse", action="store_true", help="reuse a corpus built by a previous run")
+    args = parser.parse_args()
+
+    # config.py reads these at import time; load_dotenv() does not override them
+    os.environ["MONGO_URI"] = args.uri
+    os.environ["DATABASE_NAME"] = args.database
+    import database
+    import schema
+
+    if not args.reuse:
+        await build_corpus(database, schema, args.files, args.seed)
+
+    rng = random.Random(args.seed + 1)
+    queries = []
+    for _ in range(args.queries):
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        if rng.random() < 0.3:
+            words.append(rng.choice(QUALITIES))
+        queries.append(" ".join(words))
+
+    async def regex_plan(query):
+        return {"file_name": {"$regex": query, "$options": "i"}}
+
+    await measure("regex", regex_plan, queries, database)
+    await measure("tokens", database.plan_search, queries, database)
+
+    def misspell(word: str) -> str:
+        if len(word) < 5:
+            return word
+        i = rng.randrange(1, len(word) - 1)
+        return word[:i] + word[i + 1:]
+
+    typo_queries = [" ".join(misspell(w) for w in rng.sample(WORDS, rng.randint(1, 3))) for _ in range(args.queries)]
+
+    async def fuzzy_plan(query):
+        corrected = await database.correct_query(query)
+        return await database.plan_search(corrected or query)
+
+    await measure("fuzzy", fuzzy_plan, typo_queries, database)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
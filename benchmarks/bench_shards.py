@@ -0,0 +1,158 @@
+"""Measure message throughput as sharded workers are added.
+
+Shards are assigned to workers by ``ShardCoordinator`` over a
+``LocalLeaseStore``. As with Telegram, every worker process receives every
+synthetic group message as a raw update, decodes it and drops it unless it
+owns the chat's shard. The owner runs the CPU-bound part of ``auto_filter``
+(manual filter matching, query tokenizing and parsing the result names) in
+its own event loop, plus a simulated database round trip. The decode and
+drop cost every worker pays for every update is what bounds the scaling.
+
+    python benchmarks/bench_shards.py --workers 1 2 4 8 --messages 20000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_search import WORDS, synthetic_name  # noqa: E402
+
+BATCH = 200
+
+
+def worker(inbox, done, owned: set, shard_count: int, filters_per_chat: int, results: int, latency: float,
+           seed: int):
+    from filter_matcher import ChatFilters
+    from metadata import parse_filename
+    from search import tokenize
+    from sharding import shard_of
+
+    rng = random.Random(seed)
+    names = [synthetic_name(rng) for _ in range(1000)]
+    chats = {}
+
+    async def handle(chat_id: int, text: str):
+        chat = chats.get(chat_id)
+        if chat is None:
+            chat_rng = random.Random(chat_id)
+            chat = chats[chat_id] = ChatFilters([
+                {"keyword": " ".join(chat_rng.sample(WORDS, 2)), "file_id": str(n)} for n in range(filters_per_chat)
+            ])
+        if chat.match(text):
+            return
+        tokenize(text)
+        await asyncio.sleep(latency)
+        for name in rng.sample(names, results):
+            parse_filename(name)
+
+    async def run():
+        handled = 0
+        while True:
+            batch = await asyncio.get_running_loop().run_in_executor(None, inbox.get)
+            if batch is None:
+                break
+            mine = []
+            for raw in batch:
+                update = json.loads(raw)
+                chat_id = update["message"]["chat"]["id"]
+                if shard_of(chat_id, shard_count) in owned:
+                    mine.append((chat_id, update["message"]["text"]))
+            await asyncio.gather(*(handle(chat_id, text) for chat_id, text in mine))
+            handled += len(mine)
+        done.put(handled)
+
+    asyncio.run(run())
+
+
+async def assign_shards(workers: int, shard_count: int) -> dict:
+    """Let coordinators over one local lease store settle on an assignment"""
+    from sharding import LocalLeaseStore, ShardCoordinator
+
+    store = LocalLeaseStore()
+    coordinators = [ShardCoordinator(store, f"worker-{n}", shard_count) for n in range(workers)]
+    for _ in range(3):
+        for coordinator in coordinators:
+            await coordinator.rebalance()
+    return [coordinator.shards for coordinator in coordinators]
+
+
+def raw_update(update_id: int, chat_id: int, text: str) -> str:
+    """A group message update roughly as the Bot API serializes it"""
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": {"id": update_id % 100000, "is_bot": False, "first_name": "User", "language_code": "en"},
+            "chat": {"id": chat_id, "title": "Movies Group", "type": "supergroup"},
+            "date": 1700000000 + update_id,
+            "text": text,
+        },
+    })
+
+
+def run(workers: int, args) -> dict:
+    shards = asyncio.run(assign_shards(workers, args.shards))
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    done = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(inboxes[n], done, shards[n], args.shards, args.filters, args.results, args.latency, n),
+            daemon=True
+        )
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    rng = random.Random(args.seed)
+    messages = [
+        raw_update(n, -1000000000000 - rng.randrange(args.chats), " ".join(rng.sample(WORDS, 3)))
+        for n in range(args.messages)
+    ]
+    start = time.perf_counter()
+    for offset in range(0, len(messages), BATCH):
+        batch = messages[offset:offset + BATCH]
+        for inbox in inboxes:
+            inbox.put(batch)
+    for inbox in inboxes:
+        inbox.put(None)
+    handled = sum(done.get() for _ in range(workers))
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return {"workers": workers, "messages": handled, "elapsed_s": elapsed, "throughput_mps": handled / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=500, help="distinct groups sending messages")
+    parser.add_argument("--filters", type=int, default=50, help="manual filters per chat")
+    parser.add_argument("--results", type=int, default=10, help="result names parsed per message")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated database round trip (seconds)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.shards} shards, {args.messages} messages")
+    baseline = None
+    for workers in args.workers:
+        result = run(workers, args)
+        baseline = baseline or result["throughput_mps"]
+        print(
+            f"{workers:>3} workers: {result['throughput_mps']:>9.0f} msg/s "
+            f"({result['throughput_mps'] / baseline:.2f}x) in {result['elapsed_s']:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""Replay synthetic traffic through the bot's handlers, without Telegram.
+
+``bot.py`` is imported unchanged and its handlers are called directly with
+fake messages and callback queries. A ``FakeClient`` stands in for the
+Pyrogram client: it records every API call and charges it a simulated
+Telegram round trip. MongoDB is the in-memory stand-in by default, or a real
+server with ``--uri``; the run then uses its own ``--database``, which is
+dropped before and after.
+
+Scenarios, each replayed at ``--rate`` updates per second:
+
+- ``search``: group messages through ``auto_filter``, some of them chatter
+- ``callbacks``: presses of the result buttons (page, file, all, quality)
+- ``index``: channel posts through ``index_new_file``, some of them reposts
+- ``broadcast``: one ``/broadcast`` to ``--users`` users, run to completion
+
+Each scenario reports p50/p99 handler latency (from the scheduled arrival,
+so queueing counts), throughput, Telegram calls and peak memory.
+
+    python benchmarks/loadtest.py --files 20000 --rate 200 --duration 10
+    python benchmarks/loadtest.py --uri mongodb://localhost:27017 --scenarios search callbacks
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from types import SimpleNamespace
+from typing import Awaitable, Callable, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_search import synthetic_name  # noqa: E402
+from memory_mongo import InMemoryCollection  # noqa: E402
+from search import trigrams  # noqa: E402
+
+ADMIN_ID = 1
+STORE_CHANNEL = -1001000000001
+LOG_CHANNEL = -1001000000002
+SCENARIOS = ("search", "callbacks", "index", "broadcast")
+DROP_REASONS = ("link", "no_words", "too_short", "too_long", "user_rate_limited", "chat_rate_limited",
+                "delivery_queue_full")
+CHATTER = ["hi", "ok", "😂😂", "👍", "https://example.com/watch", "t.me/somechannel", "lol", "thanks!!"]
+
+
+class FakeClient:
+    """Stand-in for pyrogram's Client that records calls instead of making them"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.buttons: List[str] = []
+        self._message_ids = itertools.count(1)
+
+    async def _call(self, method: str, chat_id: int, **fields) -> "FakeMessage":
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeMessage(self, chat_id, **fields)
+
+    def message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def send_message(self, chat_id: int, text: str, reply_markup=None, **kwargs):
+        if reply_markup is not None:
+            self.buttons += [button.callback_data for row in reply_markup.inline_keyboard for button in row]
+        return await self._call("send_message", chat_id, text=text)
+
+    async def send_cached_media(self, chat_id: int, file_id: str, caption: str = "", **kwargs):
+        return await self._call("send_cached_media", chat_id, caption=caption)
+
+    async def send_media_group(self, chat_id: int, media: list, **kwargs):
+        message = await self._call("send_media_group", chat_id)
+        return [message] * len(media)
+
+    async def send_photo(self, chat_id: int, photo: str, caption: str = "", **kwargs):
+        return await self._call("send_photo", chat_id, caption=caption)
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int, **kwargs):
+        return await self._call("copy_message", chat_id)
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs):
+        return await self._call("edit_message_text", chat_id, text=text)
+
+    async def answer_callback_query(self, callback_query_id: str, text: str = "", **kwargs):
+        self.calls["answer_callback_query"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return True
+
+    async def get_messages(self, chat_id: int, message_ids):
+        return await self._call("get_messages", chat_id)
+
+    async def get_chat(self, chat_id):
+        self.calls["get_chat"] += 1
+        return SimpleNamespace(id=chat_id, title=f"Chat {chat_id}")
+
+
+class FakeMessage:
+    """The parts of a pyrogram Message the handlers read"""
+
+    def __init__(self, client: FakeClient, chat_id: int, text: Optional[str] = None, caption: str = "",
+                 from_user: Optional[int] = None, command: Optional[List[str]] = None,
+                 reply_to_message: Optional["FakeMessage"] = None, **media):
+        self._client = client
+        self.id = client.message_id()
+        self.chat = SimpleNamespace(id=chat_id, title=f"Chat {chat_id}")
+        self.from_user = SimpleNamespace(id=from_user, username="", first_name="User") if from_user else None
+        self.sender_chat = None
+        self.text = text
+        self.caption = caption
+        self.command = command
+        self.reply_to_message = reply_to_message
+        self.forward_from_chat = None
+        self.forward_from_message_id = None
+        self.empty = False
+        self.media = bool(media)
+        for kind in ("document", "video", "audio", "photo"):
+            setattr(self, kind, media.get(kind))
+
+    async def reply_text(self, text: str, reply_markup=None, **kwargs):
+        return await self._client.send_message(self.chat.id, text, reply_markup=reply_markup)
+
+    async def edit_text(self, text: str, reply_markup=None, **kwargs):
+        if reply_markup is not None:
+            self._client.buttons += [b.callback_data for row in reply_markup.inline_keyboard for b in row]
+        return await self._client.edit_message_text(self.chat.id, self.id, text)
+
+
+class FakeCallbackQuery:
+    """A result button press"""
+
+    def __init__(self, client: FakeClient, data: str, user_id: int, chat_id: int):
+        self.id = str(client.message_id())
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, username="", first_name="User")
+        self.message = FakeMessage(client, chat_id)
+        self._client = client
+
+    async def answer(self, text: str = "", show_alert: bool = False, **kwargs):
+        return await self._client.answer_callback_query(self.id, text)
+
+
+def configure_environment(args):
+    """Settings config.py reads at import time; nothing here reaches Telegram"""
+    os.environ.update({
+        "API_ID": "1",
+        "API_HASH": "0" * 32,
+        "BOT_TOKEN": "1:loadtest",
+        "MONGO_URI": args.uri or "mongodb://localhost:27017",
+        "DATABASE_NAME": args.database,
+        "ADMINS": str(ADMIN_ID),
+        "FILE_STORE_CHANNEL": str(STORE_CHANNEL),
+        "LOG_CHANNEL": str(LOG_CHANNEL),
+    })
+
+
+def peak_memory_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+async def replay(updates: list, rate: float, handle: Callable[..., Awaitable]) -> dict:
+    """Start one handler per update at a fixed arrival rate and time each from its arrival"""
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+    errors = Counter()
+    start = loop.time()
+
+    async def run(arrival: float, update):
+        await asyncio.sleep(max(0.0, start + arrival - loop.time()))
+        try:
+            await handle(update)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append(loop.time() - start - arrival)
+
+    await asyncio.gather(*(run(n / rate, update) for n, update in enumerate(updates)))
+    elapsed = loop.time() - start
+    latencies.sort()
+    return {
+        "handled": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000 if latencies else 0.0,
+        "errors": dict(errors),
+    }
+
+
+async def seed(database, args, rng: random.Random) -> List[str]:
+    """Store ``--files`` synthetic files and ``--users`` users; return the file names"""
+    names = [synthetic_name(rng) for _ in range(args.files)]
+    docs = [
+        database.file_document(STORE_CHANNEL, f"file{n}", name, rng.choice(["video", "document"]),
+                               file_unique_id=f"unique{n}", file_size=rng.randrange(1 << 20, 1 << 32))
+        for n, name in enumerate(names)
+    ]
+    users = [{"user_id": 10000 + n, "username": "", "blocked": False} for n in range(args.users)]
+    if args.uri:
+        for batch in range(0, len(docs), 1000):
+            await database.save_files_bulk(docs[batch:batch + 1000])
+        if users:
+            await database.col_users.insert_many(users)
+    else:
+        # Straight into the stand-in; its upserts scan every document
+        frequency = Counter()
+        for n, doc in enumerate(docs, 1):
+            doc["_id"] = n
+            frequency.update(doc["tokens"])
+        database.col_files.docs.extend(docs)
+        database.col_tokens.docs.extend(
+            {"_id": token, "df": df, "trigrams": trigrams(token), "len": len(token)} for token, df in frequency.items()
+        )
+        database.col_users.docs.extend(users)
+    return names
+
+
+def search_messages(client: FakeClient, args, names: List[str], rng: random.Random) -> list:
+    messages = []
+    for _ in range(int(args.rate * args.duration)):
+        if rng.random() < args.chatter:
+            text = rng.choice(CHATTER)
+        else:
+            # What people type: a few words of a title, sometimes with a typo
+            title = rng.choice(names).split("] ", 1)[-1].split(".")
+            text = " ".join(title[:rng.randint(1, 3)]).lower()
+            if rng.random() < 0.1 and len(text) > 4:
+                cut = rng.randrange(len(text) - 1)
+                text = text[:cut] + text[cut + 1:]
+        chat_id = -1002000000000 - rng.randrange(args.chats)
+        messages.append(FakeMessage(client, chat_id, text=text, from_user=20000 + rng.randrange(args.senders)))
+    return messages
+
+
+async def run_search(bot, client: FakeClient, args, names, rng) -> dict:
+    return await replay(search_messages(client, args, names, rng), args.rate, lambda m: bot.auto_filter(client, m))
+
+
+async def run_callbacks(bot, client: FakeClient, args, names, rng) -> dict:
+    # Result keyboards to press come from searches run beforehand, untimed
+    client.buttons.clear()
+    for message in search_messages(client, args, names, rng)[:args.chats * 5]:
+        await bot.auto_filter(client, message)
+    buttons = [data for data in client.buttons if data.split(":", 1)[0] in ("page", "file", "all", "quality")]
+    if not buttons:
+        return {"handled": 0, "elapsed_s": 0.0, "throughput": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "errors": {}}
+    handlers = {
+        "page": bot.page_callback,
+        "file": bot.file_callback,
+        "all": bot.all_callback,
+        "quality": bot.quality_callback,
+    }
+    presses = [
+        FakeCallbackQuery(client, rng.choice(buttons), 20000 + rng.randrange(args.senders),
+                          -1002000000000 - rng.randrange(args.chats))
+        for _ in range(int(args.rate * args.duration))
+    ]
+    return await replay(presses, args.rate, lambda q: handlers[q.data.split(":", 1)[0]](client, q))
+
+
+async def run_index(bot, client: FakeClient, args, names, rng) -> dict:
+    posts = []
+    for n in range(int(args.rate * args.duration)):
+        if rng.random() < args.reposts:
+            unique = rng.randrange(args.files)
+        else:
+            unique = args.files + n
+        media = SimpleNamespace(
+            file_id=f"file{unique}", file_unique_id=f"unique{unique}", file_name=synthetic_name(rng),
+            file_size=rng.randrange(1 << 20, 1 << 32)
+        )
+        posts.append(FakeMessage(client, STORE_CHANNEL, video=media))
+    return await replay(posts, args.rate, lambda m: bot.index_new_file(client, m))
+
+
+async def run_broadcast(bot, client: FakeClient, args, names, rng) -> dict:
+    source = FakeMessage(client, ADMIN_ID, text="Announcement", from_user=ADMIN_ID)
+    command = FakeMessage(client, ADMIN_ID, text="/broadcast", from_user=ADMIN_ID, command=["broadcast"],
+                          reply_to_message=source)
+    start = time.perf_counter()
+    await bot.broadcast_command(client, command)
+    await asyncio.gather(*bot.job_tasks)
+    elapsed = time.perf_counter() - start
+    sent = client.calls["copy_message"]
+    return {
+        "handled": sent,
+        "elapsed_s": elapsed,
+        "throughput": sent / elapsed if elapsed else 0.0,
+        # One job; its duration is the figure that matters
+        "p50_ms": None,
+        "p99_ms": None,
+        "errors": {},
+    }
+
+
+def latency_text(ms: Optional[float]) -> str:
+    return f"{ms:>7.1f} ms" if ms is not None else f"{'-':>7}   "
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--uri", help="MongoDB to run against instead of the in-memory stand-in")
+    parser.add_argument("--database", default="AutoFilterBotLoadTest", help="database used with --uri (dropped)")
+    parser.add_argument("--files", type=int, default=5000, help="files indexed before the run")
+    parser.add_argument("--users", type=int, default=250, help="users a broadcast is sent to")
+    parser.add_argument("--rate", type=float, default=100, help="updates per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of traffic per scenario")
+    parser.add_argument("--chats", type=int, default=200, help="groups sending messages")
+    parser.add_argument("--senders", type=int, default=2000, help="users sending messages")
+    parser.add_argument("--chatter", type=float, default=0.3, help="share of group messages that are not searches")
+    parser.add_argument("--reposts", type=float, default=0.2, help="share of channel posts that are reposts")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="simulated MongoDB round trip (seconds)")
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="simulated Telegram API call (seconds)")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    configure_environment(args)
+    import bot
+    import database
+
+    if args.uri:
+        from schema import ensure_indexes
+        await database.mongo_client.drop_database(args.database)
+        await ensure_indexes()
+    else:
+        for name in dir(database):
+            if name.startswith("col_"):
+                setattr(database, name, InMemoryCollection(args.db_latency))
+
+    client = FakeClient(args.tg_latency)
+    # Handlers reach the client through the module globals and the shared services
+    bot.app = client
+    bot.deliverer.client = client
+    await bot.coordinator.rebalance()
+    bot.deliverer.start()
+    bot.log_sink.start()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    names = await seed(database, args, rng)
+    print(f"Seeded {args.files} files and {args.users} users in {time.perf_counter() - started:.1f}s, "
+          f"{'MongoDB at ' + args.uri if args.uri else 'in-memory database'}")
+
+    runners = {"search": run_search, "callbacks": run_callbacks, "index": run_index, "broadcast": run_broadcast}
+    if args.tracemalloc:
+        tracemalloc.start()
+    for scenario in args.scenarios:
+        if args.tracemalloc:
+            tracemalloc.reset_peak()
+        calls_before = sum(client.calls.values())
+        result = await runners[scenario](bot, client, args, names, rng)
+        # Handlers only queue files; count the sends of this scenario in it
+        while bot.deliverer.stats()["queued_chats"]:
+            await asyncio.sleep(0.05)
+        line = (
+            f"{scenario:>9}: {result['handled']:>6} updates, {result['throughput']:>7.1f}/s, "
+            f"p50 {latency_text(result['p50_ms'])}, p99 {latency_text(result['p99_ms'])}, "
+            f"{sum(client.calls.values()) - calls_before:>6} Telegram calls, peak RSS {peak_memory_mb():.0f} MB"
+        )
+        if args.tracemalloc:
+            line += f", heap peak {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MB"
+        if result["errors"]:
+            line += f", errors {result['errors']}"
+        print(line)
+
+    dropped = {reason: bot.AUTO_FILTER_DROPPED.labels(reason=reason).value for reason in DROP_REASONS}
+    print(f"auto_filter dropped: {dropped}")
+    print(f"delivery: {bot.deliverer.stats()}")
+    print(f"search cache: {database.search_cache.stats()}")
+    print(f"Telegram calls: {dict(client.calls)}")
+
+    await bot.deliverer.close()
+    await bot.log_sink.close(timeout=1)
+    await bot.coordinator.close()
+    if args.uri:
+        await database.mongo_client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,380 @@
+"""Minimal in-memory stand-in for the MongoDB collections used by the bot.
+
+Only the query operators and collection methods the benchmarks exercise are
+implemented. Every operation can be charged a simulated round-trip latency so
+benchmarks can model a remote server without one being available.
+"""
+import asyncio
+import copy
+import itertools
+import re
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+_ids = itertools.count(1)
+
+
+def _get(doc: dict, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _match_value(value: Any, cond: Any) -> bool:
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(v in arg for v in values):
+                    return False
+            elif op == "$nin":
+                values = value if isinstance(value, list) else [value]
+                if any(v in arg for v in values):
+                    return False
+            elif op == "$all":
+                values = value if isinstance(value, list) else [value]
+                if not all(a in values for a in arg):
+                    return False
+            elif op == "$ne":
+                if value == arg:
+                    return False
+            elif op == "$exists":
+                if (value is not None) != bool(arg):
+                    return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+            elif op == "$regex":
+                flags = re.I if "i" in cond.get("$options", "") else 0
+                values = value if isinstance(value, list) else [value]
+                pattern = re.compile(arg, flags)
+                if not any(isinstance(v, str) and pattern.search(v) for v in values):
+                    return False
+            elif op == "$options":
+                continue
+            else:
+                raise NotImplementedError(op)
+        return True
+    if isinstance(value, list) and not isinstance(cond, list):
+        return cond in value
+    return value == cond
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif not _match_value(_get(doc, key), cond):
+            return False
+    return True
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v}
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in projection}
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            doc.update(copy.deepcopy(fields))
+        elif op == "$inc":
+            for key, amount in fields.items():
+                doc[key] = doc.get(key, 0) + amount
+        elif op == "$unset":
+            for key in fields:
+                doc.pop(key, None)
+        elif op == "$setOnInsert":
+            continue
+        else:
+            raise NotImplementedError(op)
+
+
+class InMemoryCursor:
+    def __init__(self, collection: "InMemoryCollection", query: dict, projection: Optional[dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _run(self) -> List[dict]:
+        docs = self._collection.scan(self._query)
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: (_get(d, key) is not None, _get(d, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(d, self._projection) for d in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self._collection._roundtrip()
+        docs = self._run()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._collection._roundtrip()
+        for doc in self._run():
+            yield doc
+
+
+class InMemoryAggregateCursor:
+    """Result of ``aggregate``, which the async driver returns already run"""
+
+    def __init__(self, docs: List[dict]):
+        self._docs = docs
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return self._docs[:length] if length else self._docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+
+class InMemoryCollection:
+    """Async collection backed by a Python list.
+
+    ``latency`` is the simulated server round trip in seconds. With
+    ``blocking=True`` the latency is charged with ``time.sleep`` to model a
+    synchronous driver called from inside the event loop.
+    """
+
+    def __init__(self, latency: float = 0.0, blocking: bool = False):
+        self.docs: List[dict] = []
+        self.latency = latency
+        self.blocking = blocking
+        self._writes = 0
+        self._postings: Dict[str, List[dict]] = {}
+        self._postings_state: Optional[tuple] = None
+
+    async def _roundtrip(self):
+        if not self.latency:
+            return
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+
+    def scan(self, query: dict) -> List[dict]:
+        """Documents matching ``query``, in insertion order
+
+        A ``tokens: {"$all": [...]}`` condition starts from the documents of
+        its rarest token, like the multikey index on ``tokens`` would, so the
+        stand-in's own cost doesn't drown out the bot's in benchmarks.
+        """
+        docs = self.docs
+        tokens = query.get("tokens")
+        if isinstance(tokens, dict) and tokens.get("$all"):
+            state = (id(self.docs), len(self.docs), self._writes)
+            if self._postings_state != state:
+                self._postings = {}
+                for doc in self.docs:
+                    for token in set(doc.get("tokens") or ()):
+                        self._postings.setdefault(token, []).append(doc)
+                self._postings_state = state
+            docs = min((self._postings.get(token, []) for token in tokens["$all"]), key=len)
+        return [doc for doc in docs if matches(doc, query)]
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> InMemoryCursor:
+        return InMemoryCursor(self, query or {}, projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.limit(1).to_list()
+        return docs[0] if docs else None
+
+    def _insert(self, doc: dict):
+        self._writes += 1
+        doc.setdefault("_id", next(_ids))
+        self.docs.append(copy.deepcopy(doc))
+        return doc["_id"]
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool):
+        self._writes += 1
+        count = 0
+        for doc in self.docs:
+            if matches(doc, query):
+                _apply_update(doc, update, inserting=False)
+                count += 1
+                if not many:
+                    break
+        if count or not upsert:
+            return SimpleNamespace(matched_count=count, modified_count=count, upserted_id=None)
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        _apply_update(doc, update, inserting=True)
+        doc.setdefault("_id", next(_ids))
+        self.docs.append(doc)
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    def _delete(self, query: dict, many: bool) -> int:
+        self._writes += 1
+        if many:
+            before = len(self.docs)
+            self.docs = [d for d in self.docs if not matches(d, query)]
+            return before - len(self.docs)
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[i]
+                return 1
+        return 0
+
+    async def insert_one(self, doc: dict):
+        await self._roundtrip()
+        return SimpleNamespace(inserted_id=self._insert(doc))
+
+    async def insert_many(self, docs: Iterable[dict], ordered: bool = True):
+        await self._roundtrip()
+        return SimpleNamespace(inserted_ids=[self._insert(doc) for doc in docs])
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await self._roundtrip()
+        return self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False):
+        await self._roundtrip()
+        return self._update(query, update, upsert, many=True)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        await self._roundtrip()
+        self._writes += 1
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                self.docs[i] = {**copy.deepcopy(replacement), "_id": doc["_id"]}
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+        doc = {**copy.deepcopy(replacement), "_id": replacement.get("_id", query.get("_id", next(_ids)))}
+        self.docs.append(doc)
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    async def delete_one(self, query: dict):
+        await self._roundtrip()
+        return SimpleNamespace(deleted_count=self._delete(query, many=False))
+
+    async def delete_many(self, query: dict):
+        await self._roundtrip()
+        return SimpleNamespace(deleted_count=self._delete(query, many=True))
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        """Apply pymongo ``InsertOne``, ``UpdateOne``/``UpdateMany`` and ``DeleteOne``/``DeleteMany`` in one round trip"""
+        await self._roundtrip()
+        upserted, inserted, modified, deleted = {}, 0, 0, 0
+        for index, request in enumerate(requests):
+            kind = type(request).__name__
+            if kind == "InsertOne":
+                self._insert(request._doc)
+                inserted += 1
+            elif kind in ("UpdateOne", "UpdateMany"):
+                result = self._update(request._filter, request._doc, bool(request._upsert), kind == "UpdateMany")
+                if result.upserted_id is not None:
+                    upserted[index] = result.upserted_id
+                modified += result.modified_count
+            elif kind in ("DeleteOne", "DeleteMany"):
+                deleted += self._delete(request._filter, kind == "DeleteMany")
+            else:
+                raise NotImplementedError(kind)
+        return SimpleNamespace(
+            upserted_ids=upserted, inserted_count=inserted, modified_count=modified, deleted_count=deleted
+        )
+
+    async def aggregate(self, pipeline: List[dict]) -> InMemoryAggregateCursor:
+        """Run ``$match``, ``$group`` (by one field, counting), ``$sort``, ``$limit`` and ``$project``
+
+        Other stages, such as the scoring ``$addFields`` of ``search_files``,
+        are skipped, so sorts on fields they would compute fall back to the
+        remaining keys.
+        """
+        await self._roundtrip()
+        docs = self.docs
+        for stage in pipeline:
+            (name, arg), = stage.items()
+            if name == "$match":
+                docs = self.scan(arg) if docs is self.docs else [doc for doc in docs if matches(doc, arg)]
+            elif name == "$group":
+                counts = Counter(_get(doc, arg["_id"].lstrip("$")) for doc in docs)
+                docs = [{"_id": value, "count": count} for value, count in counts.items()]
+            elif name == "$sort":
+                docs = list(docs)
+                for key, direction in reversed(list(arg.items())):
+                    docs.sort(key=lambda d: (_get(d, key) is not None, _get(d, key)), reverse=direction < 0)
+            elif name == "$limit":
+                docs = docs[:arg]
+            elif name == "$project":
+                docs = [_project(doc, arg) for doc in docs]
+        return InMemoryAggregateCursor([copy.deepcopy(doc) for doc in docs])
+
+    async def count_documents(self, query: dict) -> int:
+        await self._roundtrip()
+        return len(self.scan(query))
+
+    async def estimated_document_count(self) -> int:
+        await self._roundtrip()
+        return len(self.docs)
+
+    async def create_index(self, *args, **kwargs):
+        return None
+
+    async def create_indexes(self, *args, **kwargs):
+        return []
+
+
+class InMemoryDatabase:
+    def __init__(self, latency: float = 0.0, blocking: bool = False):
+        self.latency = latency
+        self.blocking = blocking
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(self.latency, self.blocking)
+        return self._collections[name]
+
+    async def command(self, name: str, *args, **kwargs):
+        await self[name]._roundtrip()
+        return {"ok": 1}
@@ -1,8 +1,10 @@
-import os
-import re
+import asyncio
 import logging
-from typing import Dict, List, Union, Optional
-from pyrogram import Client, filters
+import math
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Set, Union, Optional
+from pyrogram import Client, filters, idle
+from pyrogram.errors import MessageNotModified
 from pyrogram.types import (
     InlineKeyboardButton, 
     InlineKeyboardMarkup, 
@@ -10,35 +12,94 @@ from pyrogram.types import (
     CallbackQuery,
     InputMediaPhoto
 )
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from dotenv import load_dotenv
-from datetime import datetime
-
-# Load environment variables
-load_dotenv()
-
-# Environment variables
-API_ID = int(os.getenv("API_ID", 0))
-API_HASH = os.getenv("API_HASH", "")
-BOT_TOKEN = os.getenv("BOT_TOKEN", "")
-MONGO_URI = os.getenv("MONGO_URI", "")
-DATABASE_NAME = os.getenv("DATABASE_NAME", "AutoFilterBot")
-LOG_CHANNEL = int(os.getenv("LOG_CHANNEL", 0))
-REQ_CHANNEL = int(os.getenv("REQ_CHANNEL", 0))
-PICS = os.getenv("PICS", "").split()
-FILE_STORE_CHANNEL = [int(ch) for ch in os.getenv("FILE_STORE_CHANNEL", "").split()] if os.getenv("FILE_STORE_CHANNEL") else []
-LAZY_MODE = os.getenv("LAZY_MODE", "False").lower() == "true"
-ADMINS = [int(admin) for admin in os.getenv("ADMINS", "").split()] if os.getenv("ADMINS") else []
-LAZY_RENAMERS = [int(user) for user in os.getenv("LAZY_RENAMERS", "").split()] if os.getenv("LAZY_RENAMERS") else []
-URL_MODE = os.getenv("URL_MODE", "False").lower() == "true"
-URL_SHORTNER_WEBSITE = os.getenv("URL_SHORTNER_WEBSITE", "")
-URL_SHORTNER_WEBSITE_API = os.getenv("URL_SHORTNER_WEBSITE_API", "")
-LZURL_PRIME_USERS = [int(user) for user in os.getenv("LZURL_PRIME_USERS", "").split()] if os.getenv("LZURL_PRIME_USERS") else []
-LAZY_GROUPS = [int(group) for group in os.getenv("LAZY_GROUPS", "").split()] if os.getenv("LAZY_GROUPS") else []
-MY_USERS = [int(user) for user in os.getenv("MY_USERS", "").split()] if os.getenv("MY_USERS") else []
-FQDN = os.getenv("FQDN", "")
-PRIME_DOWNLOADERS = [int(user) for user in os.getenv("PRIME_DOWNLOADERS", "").split()] if os.getenv("PRIME_DOWNLOADERS") else []
+
+from config import (
+    API_ID,
+    API_HASH,
+    BOT_TOKEN,
+    LOG_CHANNEL,
+    PICS,
+    FILE_STORE_CHANNEL,
+    ADMINS,
+    LAZY_RENAMERS,
+    MY_USERS,
+    SEARCH_MAX_RESULTS,
+    RESULTS_PER_PAGE,
+    RESULT_SESSION_SIZE,
+    RESULT_SESSION_TTL,
+    INDEX_FETCH_CONCURRENCY,
+    INDEX_PROGRESS_INTERVAL,
+    BROADCAST_RATE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_PROGRESS_INTERVAL,
+    DB_EXPLAIN,
+    LOG_QUEUE_SIZE,
+    LOG_FLUSH_INTERVAL,
+    DELIVERY_CONCURRENCY,
+    DELIVERY_CHAT_RATE,
+    DELIVERY_CHAT_BURST,
+    DELIVERY_MAX_FILES,
+    DELIVERY_MAX_PENDING,
+    HEALTH_PORT,
+    READY_MAX_LOOP_LAG,
+    READY_MAX_DB_LATENCY,
+    SHARD_COUNT,
+    WORKER_ID,
+    LEASE_TTL,
+    LEASE_RENEW_INTERVAL,
+    STATS_REFRESH_INTERVAL,
+    USER_SEARCH_RATE,
+    USER_SEARCH_BURST,
+    CHAT_SEARCH_RATE,
+    CHAT_SEARCH_BURST,
+    MIN_QUERY_LENGTH,
+    MAX_QUERY_LENGTH,
+    COMPACT_BATCH_SIZE,
+    COMPACT_PAUSE,
+)
+from database import (
+    pending_migrations,
+    ping_database,
+    save_file,
+    search_files,
+    search_facets,
+    correct_query,
+    get_files_by_ids,
+    add_filter,
+    get_filter,
+    get_all_filters,
+    delete_filter,
+    delete_all_filters,
+    add_user,
+    save_thumbnail,
+    get_thumbnail,
+    get_unfinished_index_jobs,
+    get_unfinished_broadcasts,
+    send_signal,
+    get_signals,
+    get_stats,
+    refresh_stats,
+    search_cache,
+    search_flights,
+    LISTING_FIELDS,
+    DELIVERY_FIELDS,
+    filter_index,
+    profile_cache,
+    col_leases,
+)
+from broadcast import Broadcaster
+from compaction import FileCompactor
+from delivery import Deliverer
+from healthcheck import HealthServer
+from indexer import ChannelIndexer, extract_file
+from log_sink import LogSink
+from metrics import AUTO_FILTER_DROPPED, CallbackMetric, handler, instrument_client, loop_lag
+from migrate import MIGRATIONS, run as run_migrations
+from ratelimit import KeyedRateLimiter
+from search import skip_reason
+from schema import ensure_indexes, explain_queries
+from sessions import ResultSessions
+from sharding import LocalLeaseStore, MongoLeaseStore, ShardCoordinator, shard_of
 
 # Setup logging
 logging.basicConfig(
@@ -47,106 +108,112 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Connect to MongoDB
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[DATABASE_NAME]
-col_files = db["files"]          # Collection for indexed files
-col_filters = db["filters"]      # Collection for manual filters
-col_users = db["users"]          # Collection for user data
-col_thumb = db["thumbnails"]     # Collection for thumbnails
-col_settings = db["settings"]    # Collection for bot settings
-
 # Initialize the bot
-app = Client("autofilter_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+# Sharded workers can't share one session file, so each logs in afresh
+app = Client(
+    "autofilter_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN,
+    in_memory=SHARD_COUNT > 1
+)
+instrument_client(app)
 
-# Helper functions
-async def save_file(chat_id: int, file_id: str, file_name: str, file_type: str, caption: str = ""):
-    """Save file to database with quality extraction"""
-    # Extract quality from filename
-    quality = "Unknown"
-    for q in ["480p", "540p", "720p", "1080p", "2160p"]:
-        if q in file_name:
-            quality = q
-            break
-    
-    # Save to database
-    col_files.insert_one({
-        "chat_id": chat_id,
-        "file_id": file_id,
-        "file_name": file_name,
-        "file_type": file_type,
-        "quality": quality,
-        "caption": caption,
-        "timestamp": datetime.now()
-    })
-
-async def search_files(query: str, max_results: int = 50) -> list:
-    """Search files by query"""
-    regex_query = {"$regex": query, "$options": "i"}
-    return list(col_files.find({"file_name": regex_query}).limit(max_results))
-
-async def add_filter(chat_id: int, keyword: str, file_id: str, caption: str = ""):
-    """Add manual filter"""
-    col_filters.update_one(
-        {"chat_id": chat_id, "keyword": keyword.lower()},
-        {"$set": {"file_id": file_id, "caption": caption}},
-        upsert=True
-    )
+# Log channel messages are queued and sent as periodic digests
+log_sink = LogSink(
+    lambda text: app.send_message(LOG_CHANNEL, text),
+    max_queue=LOG_QUEUE_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL
+)
 
-async def get_filter(chat_id: int, keyword: str) -> Optional[dict]:
-    """Get manual filter"""
-    return col_filters.find_one({"chat_id": chat_id, "keyword": keyword.lower()})
-
-async def get_all_filters(chat_id: int) -> list:
-    """Get all manual filters for a chat"""
-    return list(col_filters.find({"chat_id": chat_id}))
-
-async def delete_filter(chat_id: int, keyword: str) -> bool:
-    """Delete manual filter"""
-    result = col_filters.delete_one({"chat_id": chat_id, "keyword": keyword.lower()})
-    return result.deleted_count > 0
-
-async def delete_all_filters(chat_id: int) -> int:
-    """Delete all manual filters for a chat"""
-    result = col_filters.delete_many({"chat_id": chat_id})
-    return result.deleted_count
-
-async def save_thumbnail(user_id: int, thumb_id: str, is_lazy: bool = False):
-    """Save thumbnail for renaming feature"""
-    col_thumb.update_one(
-        {"user_id": user_id, "is_lazy": is_lazy},
-        {"$set": {"thumb_id": thumb_id}},
-        upsert=True
-    )
+# Fair, rate-limited file sending shared by every handler
+deliverer = Deliverer(
+    app,
+    concurrency=DELIVERY_CONCURRENCY,
+    chat_rate=DELIVERY_CHAT_RATE,
+    chat_burst=DELIVERY_CHAT_BURST,
+    max_pending=DELIVERY_MAX_PENDING
+)
 
-async def get_thumbnail(user_id: int, is_lazy: bool = False) -> Optional[str]:
-    """Get thumbnail for renaming feature"""
-    doc = col_thumb.find_one({"user_id": user_id, "is_lazy": is_lazy})
-    return doc.get("thumb_id") if doc else None
-
-async def delete_thumbnail(user_id: int, is_lazy: bool = False) -> bool:
-    """Delete thumbnail"""
-    result = col_thumb.delete_one({"user_id": user_id, "is_lazy": is_lazy})
-    return result.deleted_count > 0
-
-async def save_caption(user_id: int, caption: str):
-    """Save custom caption"""
-    col_settings.update_one(
-        {"user_id": user_id},
-        {"$set": {"caption": caption}},
-        upsert=True
-    )
+# Searches allowed per user and per group, so a spam burst can't turn into DB scans
+user_search_limiter = KeyedRateLimiter(USER_SEARCH_RATE, USER_SEARCH_BURST)
+chat_search_limiter = KeyedRateLimiter(CHAT_SEARCH_RATE, CHAT_SEARCH_BURST)
+
+# Chats are split into shards by id; this worker only handles the shards it leases.
+# With one shard there is nothing to coordinate, so the leases stay in memory.
+coordinator = ShardCoordinator(
+    MongoLeaseStore(col_leases) if SHARD_COUNT > 1 else LocalLeaseStore(),
+    WORKER_ID,
+    shard_count=SHARD_COUNT,
+    ttl=LEASE_TTL,
+    renew_interval=LEASE_RENEW_INTERVAL,
+    # Another worker may change a moved chat's filters, so reload them if it comes back
+    on_lost=lambda shards: filter_index.evict(lambda chat_id: shard_of(chat_id, SHARD_COUNT) in shards)
+)
 
-async def get_caption(user_id: int) -> Optional[str]:
-    """Get custom caption"""
-    doc = col_settings.find_one({"user_id": user_id})
-    return doc.get("caption") if doc else None
+# Background tasks of the indexing and broadcast jobs, which only run on the leader
+job_tasks: Set[asyncio.Task] = set()
 
-async def delete_caption(user_id: int) -> bool:
-    """Delete custom caption"""
-    result = col_settings.delete_one({"user_id": user_id})
-    return result.deleted_count > 0
+# Channel indexing jobs running in this process
+index_jobs: Dict[int, ChannelIndexer] = {}
 
+# Broadcasts running in this process
+broadcasts: Set[Broadcaster] = set()
+
+# Duplicate compaction running in this process, at most one
+compactors: Set[FileCompactor] = set()
+
+# Result keyboards of recent searches
+result_sessions = ResultSessions(max_entries=RESULT_SESSION_SIZE, ttl=RESULT_SESSION_TTL)
+
+# Cache and queue state, read when /metrics is scraped
+CACHES = {
+    "search": search_cache.stats,
+    "filters": filter_index.stats,
+    "sessions": result_sessions.stats,
+    "profiles": profile_cache.stats,
+}
+CallbackMetric(
+    "bot_cache_hits_total", "Cache lookups that found a live entry",
+    lambda: {(name,): stats()["hits"] for name, stats in CACHES.items()}, ("cache",), type="counter"
+)
+CallbackMetric(
+    "bot_cache_misses_total", "Cache lookups that found nothing",
+    lambda: {(name,): stats()["misses"] for name, stats in CACHES.items()}, ("cache",), type="counter"
+)
+CallbackMetric(
+    "bot_cache_hit_ratio", "Share of cache lookups that were hits",
+    lambda: {(name,): stats()["hit_rate"] for name, stats in CACHES.items()}, ("cache",)
+)
+CallbackMetric(
+    "bot_cache_entries", "Entries held by each cache",
+    lambda: {(name,): stats()["size"] for name, stats in CACHES.items()}, ("cache",)
+)
+CallbackMetric(
+    "bot_search_requests_total", "Searches that queried the database or joined one already running",
+    lambda: {("queried",): search_flights.calls, ("coalesced",): search_flights.coalesced}, ("outcome",),
+    type="counter"
+)
+CallbackMetric("bot_search_in_flight", "Distinct searches running right now", lambda: search_flights.stats()["in_flight"])
+CallbackMetric("bot_log_queue_length", "Log channel entries waiting to be sent", lambda: log_sink.stats()["queued"])
+CallbackMetric("bot_shards_owned", "Shards leased by this worker", lambda: len(coordinator.shards))
+CallbackMetric("bot_leader", "Whether this worker is the leader", lambda: int(coordinator.is_leader))
+CallbackMetric("bot_delivery_queued_chats", "Chats with files waiting to be sent", lambda: deliverer.stats()["queued_chats"])
+
+# Readiness checks served at /ready
+async def check_database():
+    latency = await ping_database()
+    return latency <= READY_MAX_DB_LATENCY, {"latency_seconds": round(latency, 4)}
+
+async def check_telegram():
+    return app.is_connected is True, {"connected": bool(app.is_connected)}
+
+async def check_event_loop():
+    return loop_lag.lag <= READY_MAX_LOOP_LAG, {"lag_seconds": round(loop_lag.lag, 4)}
+
+health_server = HealthServer(
+    {"mongodb": check_database, "telegram": check_telegram, "event_loop": check_event_loop},
+    port=HEALTH_PORT
+)
+
+# Helper functions
 async def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
     return user_id in ADMINS
@@ -162,14 +229,25 @@ async def is_my_user(user_id: int) -> bool:
 async def log_message(text: str):
     """Log message to log channel"""
     if LOG_CHANNEL:
-        await app.send_message(LOG_CHANNEL, text)
+        log_sink.put(text)
 
 async def log_error(error: str):
     """Log error to log channel"""
     if LOG_CHANNEL:
-        await app.send_message(LOG_CHANNEL, f"🚨 **ERROR**:\n```{error}```")
+        log_sink.put(f"🚨 **ERROR**:\n```{error}```")
 
 # Bot commands and handlers
+@app.on_message(group=-1)
+@app.on_callback_query(group=-1)
+async def drop_other_shards(client: Client, update: Union[Message, CallbackQuery]):
+    """Leave updates of chats owned by another worker to that worker"""
+    if isinstance(update, CallbackQuery):
+        chat_id = update.message.chat.id if update.message else update.from_user.id
+    else:
+        chat_id = update.chat.id
+    if not coordinator.owns(chat_id):
+        update.stop_propagation()
+
 @app.on_message(filters.command("start"))
 async def start_command(client: Client, message: Message):
     """Handler for /start command"""
@@ -177,11 +255,7 @@ async def start_command(client: Client, message: Message):
     username = message.from_user.username or ""
     
     # Add user to database
-    col_users.update_one(
-        {"user_id": user_id},
-        {"$set": {"username": username, "first_seen": datetime.now()}},
-        upsert=True
-    )
+    await add_user(user_id, username)
     
     # Send welcome message with images if available
     if PICS:
@@ -303,19 +377,65 @@ async def delete_all_filters_command(client: Client, message: Message):
     count = await delete_all_filters(message.chat.id)
     await message.reply_text(f"✅ Deleted {count} filters")
 
+def breakdown_text(rows: list, limit: int = 6) -> str:
+    """Format [value, count] pairs of a stats snapshot on one line"""
+    return " • ".join(f"{value}: `{count}`" for value, count in rows[:limit]) or "-"
+
 @app.on_message(filters.command("stats"))
 async def stats_command(client: Client, message: Message):
     """Get bot statistics"""
-    file_count = col_files.count_documents({})
-    filter_count = col_filters.count_documents({})
-    user_count = col_users.count_documents({})
+    stats = await get_stats()
     
     stats_text = (
         "📊 **Bot Statistics:**\n\n"
-        f"• Total files: `{file_count}`\n"
-        f"• Total filters: `{filter_count}`\n"
-        f"• Total users: `{user_count}`"
+        f"• Total files: `{stats['files']}`\n"
+        f"• Total filters: `{stats['filters']}`\n"
+        f"• Total users: `{stats['users']}`"
     )
+    if message.from_user and await is_admin(message.from_user.id):
+        snapshot = stats["snapshot"]
+        if snapshot:
+            week_ago = f"{datetime.now() - timedelta(days=7):%Y-%m-%d}"
+            last_week = sum(count for day, count in snapshot["growth"] if day > week_ago)
+            last_month = sum(count for _, count in snapshot["growth"])
+            stats_text += (
+                f"\n\n📦 **Files** (as of {snapshot['computed_at']:%Y-%m-%d %H:%M}):\n"
+                f"• By quality: {breakdown_text(snapshot['quality'])}\n"
+                f"• By type: {breakdown_text(snapshot['file_type'])}\n"
+                f"• Top channels: {breakdown_text(snapshot['channels'], 3)}\n"
+                f"• Added in the last 7/30 days: `{last_week}/{last_month}`"
+            )
+        cache = search_cache.stats()
+        profiles = profile_cache.stats()
+        flights = search_flights.stats()
+        stats_text += (
+            "\n\n🗄 **Search cache:**\n"
+            f"• Entries: `{cache['size']}/{cache['max_entries']}`\n"
+            f"• Hits/misses: `{cache['hits']}/{cache['misses']}` (`{cache['hit_rate']:.1%}`)\n"
+            f"• Evictions: `{cache['evictions']}` • Expired: `{cache['expirations']}` • Invalidated: `{cache['invalidations']}`\n"
+            f"• Coalesced searches: `{flights['coalesced']}/{flights['calls'] + flights['coalesced']}` (`{flights['coalesce_rate']:.1%}`)\n"
+            f"• Chats with filters loaded: `{filter_index.stats()['size']}`\n"
+            f"• User profiles cached: `{profiles['size']}` (`{profiles['hit_rate']:.1%}` hits)"
+        )
+        delivery = deliverer.stats()
+        stats_text += (
+            "\n\n📤 **Delivery:**\n"
+            f"• Sent/failed: `{delivery['sent']}/{delivery['failed']}` • FloodWaits: `{delivery['flood_waits']}`\n"
+            f"• Refused (chat queue full): `{delivery['rejected']}`\n"
+            f"• Latency p50/p99: `{delivery['p50_latency']:.2f}s/{delivery['p99_latency']:.2f}s`"
+        )
+        users, chats = user_search_limiter.stats(), chat_search_limiter.stats()
+        stats_text += (
+            "\n\n🛡 **Flood protection:**\n"
+            f"• Searches and filter replies rate-limited per user/chat: `{users['limited']}/{chats['limited']}`\n"
+            f"• Users/chats tracked: `{users['keys']}/{chats['keys']}`"
+        )
+        if SHARD_COUNT > 1:
+            stats_text += (
+                f"\n\n🧩 **Worker** `{WORKER_ID}`{' (leader)' if coordinator.is_leader else ''}:\n"
+                f"• Shards: `{len(coordinator.shards)}/{SHARD_COUNT}`\n"
+                f"• Covering for other workers: `{len(coordinator.handoff | coordinator.orphans)}`"
+            )
     await message.reply_text(stats_text)
 
 @app.on_message(filters.command("logs") & filters.user(ADMINS))
@@ -327,33 +447,286 @@ async def logs_command(client: Client, message: Message):
 @app.on_message(filters.command("broadcast") & filters.user(ADMINS))
 async def broadcast_command(client: Client, message: Message):
     """Broadcast message to all users (admin only)"""
+    if len(message.command) > 1 and message.command[1] == "cancel":
+        if not coordinator.is_leader:
+            await send_signal("cancel_broadcasts")
+        for broadcaster in broadcasts:
+            broadcaster.cancelled = True
+        await message.reply_text("⛔ Cancelling running broadcasts")
+        return
+    
     if not message.reply_to_message:
         await message.reply_text("Reply to a message to broadcast it")
         return
     
-    users = col_users.find()
-    success = 0
-    failed = 0
+    status = await message.reply_text("📣 Broadcast started...")
+    broadcaster = await Broadcaster.create(
+        client, message.reply_to_message, status,
+        rate=BROADCAST_RATE,
+        concurrency=BROADCAST_CONCURRENCY,
+        progress_interval=BROADCAST_PROGRESS_INTERVAL
+    )
+    if coordinator.is_leader:
+        start_broadcast(broadcaster)
+    else:
+        await status.edit_text("📣 Broadcast queued, the leader worker will start it shortly")
+
+def start_broadcast(broadcaster: Broadcaster):
+    """Run a broadcast in the background and log one summary when it ends"""
+    broadcasts.add(broadcaster)
     
-    for user in users:
+    async def run():
         try:
-            await message.reply_to_message.copy(user["user_id"])
-            success += 1
+            job = await broadcaster.run()
+            summary = broadcaster.error_summary()
+            if summary:
+                await log_error(
+                    f"Broadcast {job['_id']} finished with {job['failed']} failed and "
+                    f"{job['blocked']} unreachable users:\n{summary}"
+                )
         except Exception as e:
-            failed += 1
-            await log_error(f"Broadcast failed for {user['user_id']}: {str(e)}")
-    
-    await message.reply_text(
-        f"📣 Broadcast completed!\n\n"
-        f"• Success: `{success}`\n"
-        f"• Failed: `{failed}`"
-    )
+            logger.exception("Broadcast failed")
+            await log_error(f"Broadcast failed: {str(e)}")
+        finally:
+            broadcasts.discard(broadcaster)
+    
+    track_job(asyncio.create_task(run()))
+
+async def resume_jobs(client: Client, jobs: List[dict], running: Callable[[dict], bool],
+                      start: Callable[[dict, Optional[Message]], None]):
+    """Start stored jobs that no task of this worker is running, reporting to their status messages"""
+    for job in jobs:
+        if running(job):
+            continue
+        status = None
+        if job.get("status_chat_id"):
+            try:
+                status = await client.get_messages(job["status_chat_id"], job["status_message_id"])
+            except Exception:
+                status = None
+        # A sweep or command may have started it while the status message was fetched
+        if running(job):
+            continue
+        start(job, status)
+
+async def resume_broadcasts(client: Client):
+    """Start stored broadcasts that no task of this worker is running"""
+    def start(job: dict, status: Optional[Message]):
+        logger.info("Resuming broadcast %s after user %s", job["_id"], job["last_user_id"])
+        start_broadcast(Broadcaster(
+            client, job, status,
+            rate=BROADCAST_RATE,
+            concurrency=BROADCAST_CONCURRENCY,
+            progress_interval=BROADCAST_PROGRESS_INTERVAL
+        ))
+
+    def running(job: dict) -> bool:
+        return any(b.job["_id"] == job["_id"] for b in broadcasts)
+
+    await resume_jobs(client, await get_unfinished_broadcasts(), running, start)
 
 @app.on_message(filters.command("index") & filters.user(ADMINS))
 async def index_command(client: Client, message: Message):
     """Index files from a channel (admin only)"""
-    # Implementation would include iterating through channel messages
-    await message.reply_text("🔍 Indexing started... This might take a while")
+    args = message.command[1:]
+    
+    if args and args[0] == "cancel":
+        if not coordinator.is_leader:
+            await send_signal("cancel_indexing")
+        for indexer in index_jobs.values():
+            indexer.cancelled = True
+        await message.reply_text("⛔ Cancelling running indexing jobs")
+        return
+    
+    # Either reply to a message forwarded from the channel or pass its id and last message id
+    forwarded = message.reply_to_message
+    if forwarded and forwarded.forward_from_chat and forwarded.forward_from_message_id:
+        chat_ref = forwarded.forward_from_chat.id
+        last_msg_id = forwarded.forward_from_message_id
+    elif len(args) >= 2 and args[1].isdigit():
+        chat_ref = int(args[0]) if args[0].lstrip("-").isdigit() else args[0]
+        last_msg_id = int(args[1])
+    else:
+        await message.reply_text(
+            "Reply to the last message forwarded from a channel with /index, "
+            "or use /index <channel_id> <last_message_id>\n"
+            "Use /index cancel to stop running jobs"
+        )
+        return
+    
+    try:
+        chat = await client.get_chat(chat_ref)
+    except Exception as e:
+        await message.reply_text(f"❌ Cannot access that channel: `{e}`")
+        return
+    
+    if chat.id in index_jobs:
+        await message.reply_text("⏳ This channel is already being indexed")
+        return
+    
+    status = await message.reply_text("🔍 Indexing started... This might take a while")
+    if coordinator.is_leader:
+        start_indexing(client, chat.id, last_msg_id, status)
+    else:
+        # Storing the job is enough, the leader picks it up on its next sweep
+        await ChannelIndexer(client, chat.id, last_msg_id, status).load()
+        await status.edit_text("🔍 Indexing queued, the leader worker will start it shortly")
+
+def start_indexing(client: Client, chat_id: int, last_msg_id: int, status: Optional[Message] = None):
+    """Run a channel indexer in the background"""
+    indexer = ChannelIndexer(
+        client, chat_id, last_msg_id, status,
+        concurrency=INDEX_FETCH_CONCURRENCY,
+        progress_interval=INDEX_PROGRESS_INTERVAL
+    )
+    index_jobs[chat_id] = indexer
+    
+    async def run():
+        try:
+            job = await indexer.run()
+            await log_message(
+                f"📥 Indexed {job['indexed']} new files from `{chat_id}` "
+                f"({job['duplicates']} duplicates, {indexer.rate():.0f} messages/min)"
+            )
+        except Exception as e:
+            logger.exception("Indexing %s failed", chat_id)
+            await log_error(f"Indexing {chat_id} failed: {str(e)}")
+        finally:
+            index_jobs.pop(chat_id, None)
+    
+    track_job(asyncio.create_task(run()))
+
+async def resume_indexing(client: Client):
+    """Start stored indexing jobs that no task of this worker is running"""
+    def start(job: dict, status: Optional[Message]):
+        logger.info("Resuming indexing of %s from message %s", job["_id"], job["next_id"])
+        start_indexing(client, job["_id"], job["last_msg_id"], status)
+
+    await resume_jobs(client, await get_unfinished_index_jobs(), lambda job: job["_id"] in index_jobs, start)
+
+@app.on_message(filters.command("compact") & filters.user(ADMINS))
+async def compact_command(client: Client, message: Message):
+    """Merge duplicate files in the database (admin only)"""
+    if len(message.command) > 1 and message.command[1] == "cancel":
+        if not coordinator.is_leader:
+            await send_signal("cancel_compaction")
+        for compactor in compactors:
+            compactor.cancelled = True
+        await message.reply_text("⛔ Cancelling duplicate compaction")
+        return
+
+    if compactors:
+        await message.reply_text("⏳ Duplicate compaction is already running")
+        return
+    if coordinator.is_leader:
+        status = await message.reply_text("🧹 Merging duplicate files...")
+        start_compaction(status)
+    else:
+        await send_signal("compact_files")
+        await message.reply_text("🧹 Compaction queued, the leader worker will report to the log channel")
+
+def start_compaction(status: Optional[Message] = None):
+    """Merge duplicate files in the background and report the space reclaimed"""
+    compactor = FileCompactor(COMPACT_BATCH_SIZE, COMPACT_PAUSE)
+    compactors.add(compactor)
+
+    async def run():
+        try:
+            report = await compactor.run()
+            summary = (
+                f"🧹 Compaction {'cancelled' if report['cancelled'] else 'finished'}: "
+                f"removed {report['removed']} duplicate copies of {report['duplicate_files']} files, "
+                f"{report['bytes_reclaimed'] / 1024 / 1024:.1f} MB reclaimed "
+                f"({report['scanned']} files checked in {report['elapsed']:.0f}s)"
+            )
+            await log_message(summary)
+            if status:
+                await status.edit_text(summary)
+        except Exception as e:
+            logger.exception("Compaction failed")
+            await log_error(f"Compaction failed: {str(e)}")
+        finally:
+            compactors.discard(compactor)
+
+    track_job(asyncio.create_task(run()))
+
+async def migrate_in_background(names: List[str]):
+    """Run pending data migrations while the bot serves; older files become searchable as they finish"""
+    logger.info("Running pending migrations: %s", ", ".join(names))
+    try:
+        await run_migrations(names)
+        await log_message(f"🔧 Migrations finished: {', '.join(names)}")
+    except Exception as e:
+        logger.exception("Migrations failed")
+        await log_error(f"Migrations failed, restart the bot or run `python migrate.py` to retry: {str(e)}")
+
+def track_job(task: asyncio.Task):
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+
+async def refresh_stats_snapshot():
+    """Recompute the /stats breakdowns in the background"""
+    try:
+        await refresh_stats()
+    except Exception as e:
+        logger.warning("Refreshing statistics failed: %s", e)
+
+async def lead(client: Client):
+    """Run indexing and broadcast jobs only while this worker holds the leader lease
+    
+    Every sweep the leader applies cancel and compaction requests sent from
+    other workers, starts stored jobs nobody is running and refreshes the /stats snapshot
+    once it is older than STATS_REFRESH_INTERVAL. Pending data migrations are
+    run once, in the background. A worker that loses the lease
+    stops its jobs without finishing them, so the new leader resumes them
+    from their last checkpoint instead of running them twice.
+    """
+    checked_at = datetime.now()
+    stats_refresh: Optional[asyncio.Task] = None
+    migrations: Optional[asyncio.Task] = None
+    migrated = False
+    while True:
+        try:
+            if coordinator.is_leader:
+                if not migrated and (migrations is None or migrations.done()):
+                    if migrations is not None and not migrations.cancelled():
+                        # Finished, or failed and reported; a restart retries
+                        migrated = True
+                    else:
+                        pending = await pending_migrations(MIGRATIONS)
+                        if pending:
+                            migrations = asyncio.create_task(migrate_in_background(pending))
+                            track_job(migrations)
+                        else:
+                            migrated = True
+                # Cancel requests apply to jobs already running, not ones queued after them
+                signals = await get_signals()
+                if signals.get("cancel_indexing", checked_at) > checked_at:
+                    for indexer in index_jobs.values():
+                        indexer.cancelled = True
+                if signals.get("cancel_broadcasts", checked_at) > checked_at:
+                    for broadcaster in broadcasts:
+                        broadcaster.cancelled = True
+                if signals.get("cancel_compaction", checked_at) > checked_at:
+                    for compactor in compactors:
+                        compactor.cancelled = True
+                if signals.get("compact_files", checked_at) > checked_at and not compactors:
+                    start_compaction()
+                checked_at = max([checked_at, *signals.values()])
+                await resume_indexing(client)
+                await resume_broadcasts(client)
+                snapshot = (await get_stats())["snapshot"]
+                stale = not snapshot or (datetime.now() - snapshot["computed_at"]).total_seconds() > STATS_REFRESH_INTERVAL
+                if stale and (stats_refresh is None or stats_refresh.done()):
+                    stats_refresh = asyncio.create_task(refresh_stats_snapshot())
+                    track_job(stats_refresh)
+            elif job_tasks:
+                logger.warning("No longer the leader, stopping %d job(s)", len(job_tasks))
+                for task in list(job_tasks):
+                    task.cancel()
+        except Exception as e:
+            logger.warning("Leader sweep failed: %s", e)
+        await asyncio.sleep(LEASE_RENEW_INTERVAL)
 
 @app.on_message(filters.command("imdb"))
 async def imdb_command(client: Client, message: Message):
@@ -390,157 +763,249 @@ async def view_thumb_command(client: Client, message: Message):
         await message.reply_text("❌ No thumbnail set. Use /set_thumb to set one")
 
 # Auto-filter functionality
+def rate_limit_reason(message: Message) -> Optional[str]:
+    """Charge the sender and the group for one reply; name the limit hit, if any"""
+    # One flooding user runs out of their own tokens before the group's
+    sender = message.from_user or message.sender_chat
+    if sender and not user_search_limiter.allow(sender.id):
+        return "user_rate_limited"
+    if not chat_search_limiter.allow(message.chat.id):
+        return "chat_rate_limited"
+    return None
+
 @app.on_message(
     filters.group & 
     filters.text & 
     filters.create(lambda _, __, m: not m.command)
 )
+@handler("auto_filter")
 async def auto_filter(client: Client, message: Message):
     """Handle auto-filter requests"""
     query = message.text.strip()
-    # Rest of your function...    
-    # 1. First check manual filters
+    # 1. First check manual filters (in memory, matched anywhere in the message);
+    #    a reply sends files just like a search, so it is rate-limited the same way
     manual_filter = await get_filter(message.chat.id, query)
     if manual_filter:
-        await client.send_cached_media(
-            chat_id=message.chat.id,
-            file_id=manual_filter["file_id"],
-            caption=manual_filter.get("caption", "")
-        )
+        reason = rate_limit_reason(message)
+        if reason is None and not deliverer.deliver(message.chat.id, [manual_filter]):
+            reason = "delivery_queue_full"
+        if reason:
+            AUTO_FILTER_DROPPED.inc(reason=reason)
         return
-    
-    # 2. Then search indexed files
-    results = await search_files(query)
+
+    # 2. Ignore chatter that can't be a title, and users or groups searching too fast
+    reason = skip_reason(query, MIN_QUERY_LENGTH, MAX_QUERY_LENGTH) or rate_limit_reason(message)
+    if reason:
+        AUTO_FILTER_DROPPED.inc(reason=reason)
+        return
+
+    # 3. Then search indexed files
+    results = await search_files(query, SEARCH_MAX_RESULTS, projection=LISTING_FIELDS)
+    if not results:
+        # 4. Retry with misspelled words replaced by the closest indexed ones
+        corrected = await correct_query(query)
+        if corrected:
+            results = await search_files(corrected, SEARCH_MAX_RESULTS, projection=LISTING_FIELDS)
+            query = corrected
     if not results:
         # Stay silent if no results
         return
     
-    # Create buttons for different qualities
+    # Keep the result ids server-side; buttons only carry the session id
+    qualities = await search_facets(query, "quality")
+    session_id = result_sessions.create(query, results, qualities)
+    session = result_sessions.get(session_id)
+    await message.reply_text(
+        results_text(session, 0),
+        reply_markup=results_markup(session_id, session, 0, results[:RESULTS_PER_PAGE])
+    )
+
+def results_text(session: dict, offset: int) -> str:
+    """Header of a search result page"""
+    total = len(session["ids"])
+    pages = (total + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE
+    page = offset // RESULTS_PER_PAGE + 1
+    return f"🔍 Found {total} results for '{session['query']}' (page {page}/{pages})"
+
+# Telegram rejects keyboards with more buttons in one row
+MAX_ROW_BUTTONS = 8
+
+def results_markup(session_id: str, session: dict, offset: int, files: list) -> InlineKeyboardMarkup:
+    """Keyboard for one page of a search result"""
     buttons = []
-    qualities = {}
-    
-    # Group files by quality
-    for file in results:
-        quality = file.get("quality", "Unknown")
-        if quality not in qualities:
-            qualities[quality] = []
-        qualities[quality].append(file)
-    
-    # Create quality buttons row
-    quality_row = []
-    for quality in sorted(qualities.keys()):
-        quality_row.append(InlineKeyboardButton(quality, callback_data=f"quality:{quality}:{query}"))
-    if quality_row:
-        buttons.append(quality_row)
+    
+    # One button per file on this page
+    for index, file in enumerate(files, offset):
+        label = f"[{file.get('quality', 'Unknown')}] {file.get('file_name', '')}"
+        buttons.append([InlineKeyboardButton(label[:64], callback_data=f"file:{session_id}:{index}")])
+    
+    # Create quality buttons, in even rows of at most MAX_ROW_BUTTONS
+    quality_buttons = [
+        InlineKeyboardButton(f"{quality} ({count})", callback_data=f"quality:{session_id}:{quality}")
+        for quality, count in sorted(session["qualities"].items())
+    ]
+    if quality_buttons:
+        per_row = math.ceil(len(quality_buttons) / math.ceil(len(quality_buttons) / MAX_ROW_BUTTONS))
+        for start in range(0, len(quality_buttons), per_row):
+            buttons.append(quality_buttons[start:start + per_row])
     
     # Add "All" button
-    buttons.append([InlineKeyboardButton("All", callback_data=f"all:{query}")])
+    buttons.append([InlineKeyboardButton("All", callback_data=f"all:{session_id}:{offset}")])
     
     # Add pagination buttons
-    buttons.append([
-        InlineKeyboardButton("« Back", callback_data="page:back"),
-        InlineKeyboardButton("1/5", callback_data="page:current"),
-        InlineKeyboardButton("Next »", callback_data="page:next")
-    ])
-    
-    # Send the search results
-    await message.reply_text(
-        f"🔍 Found {len(results)} results for '{query}'",
-        reply_markup=InlineKeyboardMarkup(buttons)
-    )
+    total = len(session["ids"])
+    pages = (total + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE
+    if pages > 1:
+        page = offset // RESULTS_PER_PAGE + 1
+        buttons.append([
+            InlineKeyboardButton("« Back", callback_data=f"page:{session_id}:{max(offset - RESULTS_PER_PAGE, 0)}"),
+            InlineKeyboardButton(f"{page}/{pages}", callback_data=f"page:{session_id}:{offset}"),
+            InlineKeyboardButton("Next »", callback_data=f"page:{session_id}:{min(offset + RESULTS_PER_PAGE, (pages - 1) * RESULTS_PER_PAGE)}")
+        ])
+    
+    return InlineKeyboardMarkup(buttons)
+
+# Answer to a file button while the chat already has DELIVERY_MAX_PENDING sends queued
+DELIVERY_BUSY = "Files are still being sent to this chat, please try again in a moment"
+
+async def get_session(callback_query: CallbackQuery) -> tuple:
+    """Resolve the session a result button belongs to"""
+    parts = callback_query.data.split(":", 2)
+    # Keyboards posted before result sessions existed carry "page:next" or "all:<query>"
+    session_id, arg = (parts[1], parts[2]) if len(parts) == 3 else (None, None)
+    session = result_sessions.get(session_id) if session_id else None
+    if session is None:
+        await callback_query.answer("This search has expired, please search again", show_alert=True)
+    return session_id, session, arg
 
 # Callback query handlers
 @app.on_callback_query(filters.regex(r"^quality:"))
+@handler("quality_callback")
 async def quality_callback(client: Client, callback_query: CallbackQuery):
     """Handle quality selection"""
-    data = callback_query.data.split(":")
-    quality = data[1]
-    query = data[2]
-    
-    results = await search_files(query)
-    quality_files = [file for file in results if file.get("quality") == quality]
+    session_id, session, quality = await get_session(callback_query)
+    if session is None:
+        return
     
-    if not quality_files:
+    # The best ranked files of that quality, read with only what sending needs
+    files = await search_files(
+        session["query"], DELIVERY_MAX_FILES, filters={"quality": quality}, projection=DELIVERY_FIELDS
+    )
+    if not files:
         await callback_query.answer("No files found for this quality", show_alert=True)
         return
     
-    # For simplicity, send the first file in this quality
-    file = quality_files[0]
-    await client.send_cached_media(
-        chat_id=callback_query.message.chat.id,
-        file_id=file["file_id"],
-        caption=file.get("caption", "")
-    )
-    await callback_query.answer()
+    if not deliverer.deliver(callback_query.message.chat.id, files):
+        await callback_query.answer(DELIVERY_BUSY, show_alert=True)
+        return
+    await callback_query.answer(f"Sending {len(files)} {quality} file(s)")
 
 @app.on_callback_query(filters.regex(r"^all:"))
+@handler("all_callback")
 async def all_callback(client: Client, callback_query: CallbackQuery):
-    """Handle 'All' selection"""
-    query = callback_query.data.split(":")[1]
-    results = await search_files(query)
+    """Handle 'All' selection: send the files on the current page"""
+    session_id, session, offset = await get_session(callback_query)
+    if session is None:
+        return
     
-    if not results:
+    offset = int(offset)
+    files = await get_files_by_ids(
+        session["ids"][offset:offset + min(RESULTS_PER_PAGE, DELIVERY_MAX_FILES)],
+        DELIVERY_FIELDS
+    )
+    if not files:
         await callback_query.answer("No files found", show_alert=True)
         return
     
-    # Send all files (in a real implementation, you might send a list or batch)
-    for file in results[:5]:  # Limit to 5 files to avoid flooding
-        await client.send_cached_media(
-            chat_id=callback_query.message.chat.id,
-            file_id=file["file_id"],
-            caption=file.get("caption", "")
-        )
+    if not deliverer.deliver(callback_query.message.chat.id, files):
+        await callback_query.answer(DELIVERY_BUSY, show_alert=True)
+        return
+    await callback_query.answer(f"Sending {len(files)} file(s)")
+
+@app.on_callback_query(filters.regex(r"^file:"))
+@handler("file_callback")
+async def file_callback(client: Client, callback_query: CallbackQuery):
+    """Send a single file from a result page"""
+    session_id, session, index = await get_session(callback_query)
+    if session is None:
+        return
+    
+    index = int(index)
+    files = await get_files_by_ids(session["ids"][index:index + 1], DELIVERY_FIELDS)
+    if not files:
+        await callback_query.answer("File no longer available", show_alert=True)
+        return
     
+    if not deliverer.deliver(callback_query.message.chat.id, files):
+        await callback_query.answer(DELIVERY_BUSY, show_alert=True)
+        return
     await callback_query.answer()
 
 @app.on_callback_query(filters.regex(r"^page:"))
+@handler("page_callback")
 async def page_callback(client: Client, callback_query: CallbackQuery):
     """Handle pagination"""
-    action = callback_query.data.split(":")[1]
-    # In a full implementation, you would track pagination state
-    await callback_query.answer(f"Page {action} clicked")
+    session_id, session, offset = await get_session(callback_query)
+    if session is None:
+        return
+    
+    offset = int(offset)
+    files = await get_files_by_ids(
+        session["ids"][offset:offset + RESULTS_PER_PAGE],
+        LISTING_FIELDS
+    )
+    try:
+        await callback_query.message.edit_text(
+            results_text(session, offset),
+            reply_markup=results_markup(session_id, session, offset, files)
+        )
+    except MessageNotModified:
+        # Back on the first page, Next on the last one, or the page counter
+        pass
+    await callback_query.answer()
 
 # Index files when added to a connected channel
 @app.on_message(filters.channel & (filters.document | filters.video | filters.audio))
+@handler("index_new_file")
 async def index_new_file(client: Client, message: Message):
     """Automatically index new files in channels"""
     if message.chat.id not in FILE_STORE_CHANNEL:
         return
     
-    file_name = ""
-    file_id = ""
-    file_type = ""
-    
-    if message.document:
-        file_name = message.document.file_name or ""
-        file_id = message.document.file_id
-        file_type = "document"
-    elif message.video:
-        file_name = message.video.file_name or ""
-        file_id = message.video.file_id
-        file_type = "video"
-    elif message.audio:
-        file_name = message.audio.file_name or ""
-        file_id = message.audio.file_id
-        file_type = "audio"
-    
-    if file_id:
-        await save_file(message.chat.id, file_id, file_name, file_type, message.caption or "")
-        await log_message(f"📥 New file indexed in {message.chat.title}:\n`{file_name}`")
+    fields = extract_file(message)
+    if fields and await save_file(message.chat.id, **fields):
+        await log_message(f"📥 New file indexed in {message.chat.title}:\n`{fields['file_name']}`")
+
+async def main():
+    """Prepare the database, then run the bot until interrupted"""
+    loop_lag.start()
+    await health_server.start()
+    await ensure_indexes()
+    if DB_EXPLAIN:
+        scans = await explain_queries()
+        if scans:
+            logger.warning("Queries without index support: %s", ", ".join(scans))
+    pending = await pending_migrations(MIGRATIONS)
+    if pending:
+        logger.warning("Pending migrations: %s. The leader runs them in the background", ", ".join(pending))
+    await coordinator.rebalance()
+    coordinator.start()
+    await app.start()
+    log_sink.start()
+    deliverer.start()
+    leader = asyncio.create_task(lead(app))
+    await idle()
+    leader.cancel()
+    for task in list(job_tasks):
+        task.cancel()
+    await deliverer.close()
+    await log_sink.close()
+    await app.stop()
+    await coordinator.close()
+    await health_server.close()
+    await loop_lag.close()
 
 # Start the bot
 if __name__ == "__main__":
     print("Starting AutoFilter Bot...")
-    app.run()
-    
-    import threading
-from healthcheck import app as health_app
-
-def run_healthcheck():
-    health_app.run(host='0.0.0.0', port=8080)
-
-
-if __name__ == '__main__':
-    from healthcheck import run_server
-    run_server()  # Starts Flask
-    app.run()     # Starts your Pyrogram bot
+    app.run(main())
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from pyrogram import Client
+from pyrogram.errors import (
+    FloodWait,
+    InputUserDeactivated,
+    PeerIdInvalid,
+    UserDeactivated,
+    UserIsBlocked,
+)
+from pyrogram.types import Message
+
+from database import (
+    count_reachable_users,
+    create_broadcast,
+    get_reachable_users,
+    mark_users_blocked,
+    save_broadcast,
+)
+from jobs import CheckpointedJob
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the user can never receive messages from the bot again
+UNREACHABLE = (UserIsBlocked, InputUserDeactivated, UserDeactivated, PeerIdInvalid)
+
+USER_BATCH = 1000
+
+
+class Broadcaster(CheckpointedJob):
+    """Copy one message to every reachable user
+
+    Sends run with bounded concurrency behind a shared token bucket. A
+    FloodWait pauses every worker for the requested time and halves the send
+    rate, which then creeps back up towards ``rate`` while sends succeed.
+    Unreachable users are flagged in batches so later broadcasts skip them,
+    and the job is checkpointed after every batch of users so it can resume.
+    """
+
+    def __init__(self, client: Client, job: dict, status: Optional[Message] = None,
+                 rate: float = 25, concurrency: int = 20, progress_interval: float = 15):
+        super().__init__(status, progress_interval)
+        self.client = client
+        self.job = job
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.errors = Counter(job.get("errors", {}))
+        self._blocked: list = []
+        self._resume_at = 0.0
+        self._started = time.monotonic()
+        self._sent_this_run = 0
+
+    @classmethod
+    async def create(cls, client: Client, source: Message, status: Optional[Message] = None, **kwargs) -> "Broadcaster":
+        """Start a new broadcast of ``source``"""
+        job = await create_broadcast({
+            "status": "running",
+            "from_chat_id": source.chat.id,
+            "message_id": source.id,
+            "last_user_id": None,
+            "total": await count_reachable_users(),
+            "success": 0,
+            "failed": 0,
+            "blocked": 0,
+            "errors": {},
+            "status_chat_id": status.chat.id if status else None,
+            "status_message_id": status.id if status else None,
+            "started_at": datetime.now(),
+        })
+        return cls(client, job, status, **kwargs)
+
+    @property
+    def name(self) -> str:
+        return f"Broadcast {self.job['_id']}"
+
+    async def save(self):
+        self.job["errors"] = dict(self.errors)
+        await save_broadcast(self.job)
+
+    async def send(self, user_id: int):
+        """Deliver to one user, retrying after flood waits"""
+        for _ in range(3):
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+            try:
+                await self.client.copy_message(user_id, self.job["from_chat_id"], self.job["message_id"])
+                self.job["success"] += 1
+                self._sent_this_run += 1
+                if self.bucket.rate < self.max_rate:
+                    self.bucket.set_rate(min(self.max_rate, self.bucket.rate + 0.1))
+                return
+            except FloodWait as e:
+                self._resume_at = max(self._resume_at, time.monotonic() + e.value)
+                self.bucket.set_rate(max(1.0, self.bucket.rate / 2))
+                self.errors["FloodWait"] += 1
+            except UNREACHABLE as e:
+                self.job["blocked"] += 1
+                self._blocked.append(user_id)
+                self.errors[type(e).__name__] += 1
+                return
+            except Exception as e:
+                self.job["failed"] += 1
+                self.errors[type(e).__name__] += 1
+                return
+        self.job["failed"] += 1
+
+    async def run(self) -> dict:
+        """Broadcast to every remaining user and return the final job"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(user_id: int):
+            async with semaphore:
+                await self.send(user_id)
+
+        try:
+            while not self.cancelled:
+                users = await get_reachable_users(self.job["last_user_id"], USER_BATCH)
+                if not users:
+                    break
+                await asyncio.gather(*(worker(user["user_id"]) for user in users))
+                await mark_users_blocked(self._blocked)
+                self._blocked = []
+                self.job["last_user_id"] = users[-1]["user_id"]
+                await self.save()
+                await self.report()
+        except Exception as e:
+            await self.fail(e)
+            raise
+
+        await self.finish()
+        return self.job
+
+    def rate(self) -> float:
+        """Messages sent per second in this run"""
+        elapsed = time.monotonic() - self._started
+        return self._sent_this_run / elapsed if elapsed else 0.0
+
+    def progress_text(self, final: bool = False) -> str:
+        job = self.job
+        done = job["success"] + job["failed"] + job["blocked"]
+        title = {
+            "done": "📣 Broadcast completed!",
+            "cancelled": "⛔ Broadcast cancelled",
+            "failed": f"❌ Broadcast failed: `{job.get('error')}`",
+        }.get(job["status"], "📣 Broadcasting...")
+        return (
+            f"{title}\n\n"
+            f"• Progress: `{done}/{job['total']}`\n"
+            f"• Success: `{job['success']}`\n"
+            f"• Failed: `{job['failed']}`\n"
+            f"• Blocked/deactivated: `{job['blocked']}`\n"
+            f"• Speed: `{self.rate():.1f}` msg/s"
+        )
+
+    def error_summary(self) -> str:
+        """One aggregated line per error type"""
+        return "\n".join(f"{name}: {count}" for name, count in self.errors.most_common())
+
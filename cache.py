@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Bounded in-process cache with LRU eviction and per-entry expiry
+
+    Entries are evicted least recently used first once ``max_entries`` is
+    reached, and are treated as missing once older than ``ttl`` seconds.
+    Hit/miss/eviction counters are kept so the cache can be sized from
+    production traffic.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else default
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches ``predicate``"""
+        stale = [key for key in self._data if predicate(key)]
+        for key in stale:
+            del self._data[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key
+
+    The first caller of a key starts ``factory()`` as a task; callers that
+    arrive while it runs await the same task instead of repeating the work.
+    A caller being cancelled does not cancel the shared task.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.forgotten = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the error so it is not reported as unhandled when every caller left
+        if not task.cancelled():
+            task.exception()
+
+    def is_current(self, key: Hashable) -> bool:
+        """Whether the running task is still the flight for ``key``; False once forgotten"""
+        return self._calls.get(key) is asyncio.current_task()
+
+    def forget(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Stop sharing flights whose key matches, so later callers start afresh"""
+        stale = [key for key in self._calls if predicate(key)]
+        for key in stale:
+            del self._calls[key]
+        self.forgotten += len(stale)
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "forgotten": self.forgotten,
+            "coalesce_rate": self.coalesced / requests if requests else 0.0,
+        }
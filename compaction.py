@@ -0,0 +1,172 @@
+"""Merge duplicate files already stored in col_files.
+
+Copies of one file (same ``file_unique_id`` and size) left by reposts and
+forwards before inserts were deduplicated are merged into the oldest copy,
+after which the unique ``file_unique_id_size_unique`` index can be built.
+Files indexed before ``file_unique_id`` was stored need the
+``file_unique_ids`` migration first.
+The bot runs this on the leader with ``/compact``; it can also run on its
+own with ``python compaction.py`` (``--dry-run`` only reports).
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+from itertools import groupby
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from config import COMPACT_BATCH_SIZE, COMPACT_PAUSE
+from database import col_files, invalidate_search_cache, update_token_stats
+from schema import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+
+class FileCompactor:
+    """Walk col_files in duplicate-key order and drop every extra copy
+
+    Files are read in batches of ``batch_size`` along the
+    ``file_unique_id_size`` index, each batch a short query of its own, and
+    every batch's duplicates are removed with one ``delete_many``, so no
+    long-running cursor or write holds up the bot's own queries. ``pause``
+    seconds pass between batches. The oldest copy of a file is kept and
+    takes a caption from a duplicate if it has none. Copies of unknown size
+    (file_size 0, indexed before sizes were stored) belong to the copies
+    with a size when those all agree, and a copy with a size is kept over
+    them. Token frequencies and cached searches are corrected as
+    duplicates are removed.
+    """
+
+    def __init__(self, batch_size: int = 1000, pause: float = 0.5, dry_run: bool = False):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dry_run = dry_run
+        self.cancelled = False
+        self.scanned = 0
+        self.duplicate_files = 0
+        self.removed = 0
+        self.bytes_reclaimed = 0
+        self._started = 0.0
+
+    async def _read(self, match: dict, limit: Optional[int] = None) -> List[dict]:
+        pipeline = [{"$match": match}, {"$sort": {"file_unique_id": 1, "file_size": 1}}]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$project": {
+            "file_unique_id": 1, "file_size": 1, "tokens": 1, "caption": 1,
+            "bytes": {"$bsonSize": "$$ROOT"},
+        }})
+        cursor = await col_files.aggregate(pipeline)
+        return await cursor.to_list(None)
+
+    async def _batch(self, after: Optional[str], inclusive: bool) -> List[dict]:
+        bound = {"$gte" if inclusive else "$gt": after} if after is not None else {"$gt": ""}
+        return await self._read({"file_unique_id": bound}, self.batch_size)
+
+    @staticmethod
+    def split_sizes(copies: List[dict]) -> List[List[dict]]:
+        """Group the copies of one file_unique_id by size"""
+        sizes = {}
+        for doc in copies:
+            sizes.setdefault(doc.get("file_size") or 0, []).append(doc)
+        unknown = sizes.pop(0, [])
+        if len(sizes) == 1:
+            return [next(iter(sizes.values())) + unknown]
+        return list(sizes.values()) + ([unknown] if unknown else [])
+
+    def merge(self, copies: List[dict]):
+        """Keep the oldest of several copies of one file; return the copies to remove and the update"""
+        keeper, *duplicates = sorted(copies, key=lambda doc: (not doc.get("file_size"), doc["_id"]))
+        self.duplicate_files += 1
+        self.removed += len(duplicates)
+        self.bytes_reclaimed += sum(doc["bytes"] for doc in duplicates)
+
+        update = None
+        caption = next((doc["caption"] for doc in duplicates if doc.get("caption")), None)
+        if caption and not keeper.get("caption"):
+            update = UpdateOne({"_id": keeper["_id"]}, {"$set": {"caption": caption}})
+        return duplicates, update
+
+    async def write(self, groups: List[List[dict]]):
+        """Merge the copies of every file in one batch"""
+        ids, updates, removed_tokens = [], [], Counter()
+        for copies in groups:
+            if len(copies) < 2:
+                continue
+            duplicates, update = self.merge(copies)
+            if update:
+                updates.append(update)
+            for doc in duplicates:
+                ids.append(doc["_id"])
+                removed_tokens.update(doc.get("tokens", []))
+        if not ids or self.dry_run:
+            return
+        if updates:
+            await col_files.bulk_write(updates, ordered=False)
+        await col_files.delete_many({"_id": {"$in": ids}})
+        await update_token_stats({token: -n for token, n in removed_tokens.items()})
+        invalidate_search_cache([list(removed_tokens)])
+
+    async def run(self) -> dict:
+        """Compact the whole collection and return the report"""
+        self._started = time.monotonic()
+        after, inclusive = None, False
+        while not self.cancelled:
+            batch = await self._batch(after, inclusive)
+            if not batch:
+                break
+            self.scanned += len(batch)
+            groups = [list(copies) for _, copies in groupby(batch, lambda doc: doc["file_unique_id"])]
+            last = batch[-1]["file_unique_id"]
+            if len(batch) == self.batch_size and len(groups) > 1:
+                # The last file's copies may continue in the next batch; read them again there
+                self.scanned -= len(groups[-1])
+                groups.pop()
+                after, inclusive = last, True
+            else:
+                if len(batch) == self.batch_size:
+                    # One file's copies fill the whole batch; read all of them at once
+                    groups = [await self._read({"file_unique_id": last})]
+                    self.scanned += len(groups[0]) - len(batch)
+                after, inclusive = last, False
+            await self.write([copies for group in groups for copies in self.split_sizes(group)])
+            logger.info("compaction: %d files scanned, %d duplicates removed", self.scanned, self.removed)
+            await asyncio.sleep(self.pause)
+        if not self.dry_run and not self.cancelled:
+            # The unique file_unique_id_size_unique index can't be built while duplicates remain
+            await ensure_indexes()
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            "scanned": self.scanned,
+            "duplicate_files": self.duplicate_files,
+            "removed": self.removed,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "elapsed": time.monotonic() - self._started if self._started else 0.0,
+            "dry_run": self.dry_run,
+            "cancelled": self.cancelled,
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="count duplicates without removing them")
+    parser.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=COMPACT_PAUSE, help="seconds between batches")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    report = await FileCompactor(args.batch_size, args.pause, args.dry_run).run()
+    logger.info(
+        "%s %d duplicate copies of %d files, %.1f MB, in %.0fs",
+        "Found" if args.dry_run else "Removed", report["removed"], report["duplicate_files"],
+        report["bytes_reclaimed"] / 1024 / 1024, report["elapsed"]
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+import os
+import socket
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Environment variables
+API_ID = int(os.getenv("API_ID", 0))
+API_HASH = os.getenv("API_HASH", "")
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+MONGO_URI = os.getenv("MONGO_URI", "")
+DATABASE_NAME = os.getenv("DATABASE_NAME", "AutoFilterBot")
+LOG_CHANNEL = int(os.getenv("LOG_CHANNEL", 0))
+REQ_CHANNEL = int(os.getenv("REQ_CHANNEL", 0))
+PICS = os.getenv("PICS", "").split()
+FILE_STORE_CHANNEL = [int(ch) for ch in os.getenv("FILE_STORE_CHANNEL", "").split()] if os.getenv("FILE_STORE_CHANNEL") else []
+LAZY_MODE = os.getenv("LAZY_MODE", "False").lower() == "true"
+ADMINS = [int(admin) for admin in os.getenv("ADMINS", "").split()] if os.getenv("ADMINS") else []
+LAZY_RENAMERS = [int(user) for user in os.getenv("LAZY_RENAMERS", "").split()] if os.getenv("LAZY_RENAMERS") else []
+URL_MODE = os.getenv("URL_MODE", "False").lower() == "true"
+URL_SHORTNER_WEBSITE = os.getenv("URL_SHORTNER_WEBSITE", "")
+URL_SHORTNER_WEBSITE_API = os.getenv("URL_SHORTNER_WEBSITE_API", "")
+LZURL_PRIME_USERS = [int(user) for user in os.getenv("LZURL_PRIME_USERS", "").split()] if os.getenv("LZURL_PRIME_USERS") else []
+LAZY_GROUPS = [int(group) for group in os.getenv("LAZY_GROUPS", "").split()] if os.getenv("LAZY_GROUPS") else []
+MY_USERS = [int(user) for user in os.getenv("MY_USERS", "").split()] if os.getenv("MY_USERS") else []
+FQDN = os.getenv("FQDN", "")
+PRIME_DOWNLOADERS = [int(user) for user in os.getenv("PRIME_DOWNLOADERS", "").split()] if os.getenv("PRIME_DOWNLOADERS") else []
+
+# MongoDB connection pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+
+# Search result cache
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 2048))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 300))
+
+# Search result pagination
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 200))
+RESULTS_PER_PAGE = int(os.getenv("RESULTS_PER_PAGE", 10))
+RESULT_SESSION_SIZE = int(os.getenv("RESULT_SESSION_SIZE", 5000))
+RESULT_SESSION_TTL = int(os.getenv("RESULT_SESSION_TTL", 1800))
+
+# Channel indexing
+INDEX_FETCH_CONCURRENCY = int(os.getenv("INDEX_FETCH_CONCURRENCY", 3))
+INDEX_PROGRESS_INTERVAL = int(os.getenv("INDEX_PROGRESS_INTERVAL", 10))
+
+# Broadcasts
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+BROADCAST_PROGRESS_INTERVAL = int(os.getenv("BROADCAST_PROGRESS_INTERVAL", 15))
+
+# Log a warning for every database helper whose query is not index-backed
+DB_EXPLAIN = os.getenv("DB_EXPLAIN", "False").lower() == "true"
+
+# Manual filters kept in memory
+FILTER_CACHE_CHATS = int(os.getenv("FILTER_CACHE_CHATS", 10000))
+FILTER_CACHE_TTL = int(os.getenv("FILTER_CACHE_TTL", 3600))
+
+# Log channel digests
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 1000))
+LOG_FLUSH_INTERVAL = int(os.getenv("LOG_FLUSH_INTERVAL", 5))
+
+# File delivery
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", 8))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", 1))
+DELIVERY_CHAT_BURST = int(os.getenv("DELIVERY_CHAT_BURST", 3))
+DELIVERY_MAX_FILES = int(os.getenv("DELIVERY_MAX_FILES", 10))
+DELIVERY_MAX_PENDING = int(os.getenv("DELIVERY_MAX_PENDING", 10))
+
+# Health server
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", os.getenv("PORT", 8080)))
+READY_MAX_LOOP_LAG = float(os.getenv("READY_MAX_LOOP_LAG", 1))
+READY_MAX_DB_LATENCY = float(os.getenv("READY_MAX_DB_LATENCY", 1))
+
+# Sharded workers
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+LEASE_TTL = int(os.getenv("LEASE_TTL", 30))
+LEASE_RENEW_INTERVAL = int(os.getenv("LEASE_RENEW_INTERVAL", 10))
+
+# Statistics
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", 60))
+STATS_REFRESH_INTERVAL = int(os.getenv("STATS_REFRESH_INTERVAL", 3600))
+
+# User profile cache
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 50000))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 1800))
+
+# Auto-filter flood protection
+USER_SEARCH_RATE = float(os.getenv("USER_SEARCH_RATE", 0.5))
+USER_SEARCH_BURST = int(os.getenv("USER_SEARCH_BURST", 3))
+CHAT_SEARCH_RATE = float(os.getenv("CHAT_SEARCH_RATE", 2))
+CHAT_SEARCH_BURST = int(os.getenv("CHAT_SEARCH_BURST", 10))
+MIN_QUERY_LENGTH = int(os.getenv("MIN_QUERY_LENGTH", 3))
+MAX_QUERY_LENGTH = int(os.getenv("MAX_QUERY_LENGTH", 100))
+
+# Duplicate file compaction
+COMPACT_BATCH_SIZE = int(os.getenv("COMPACT_BATCH_SIZE", 1000))
+COMPACT_PAUSE = float(os.getenv("COMPACT_PAUSE", 0.5))
@@ -0,0 +1,677 @@
+import asyncio
+import re
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+from pymongo import AsyncMongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from config import (
+    MONGO_URI,
+    DATABASE_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_TIMEOUT_MS,
+    SEARCH_CACHE_SIZE,
+    SEARCH_CACHE_TTL,
+    FILTER_CACHE_CHATS,
+    FILTER_CACHE_TTL,
+    STATS_CACHE_TTL,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    SHARD_COUNT,
+)
+from cache import SingleFlight, TTLCache
+from filter_matcher import FilterIndex
+from metadata import METADATA_VERSION, QUALITIES, parse_filename
+from metrics import DB_QUERY_SECONDS, timed
+from search import similarity, tokenize, trigrams
+
+# Connect to MongoDB. The async client multiplexes every handler's queries over
+# one pooled set of sockets, so a slow query only suspends its own coroutine
+# instead of stalling the event loop for every other chat.
+mongo_client = AsyncMongoClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_TIMEOUT_MS,
+)
+db = mongo_client[DATABASE_NAME]
+col_files = db["files"]          # Collection for indexed files
+col_filters = db["filters"]      # Collection for manual filters
+col_users = db["users"]          # One profile per user: settings, thumbnails and caption
+col_thumb = db["thumbnails"]     # Legacy thumbnails, merged into col_users by migrate.py
+col_settings = db["settings"]    # Legacy captions, merged into col_users by migrate.py
+col_tokens = db["tokens"]        # Document frequency of every file name token
+col_migrations = db["migrations"]  # Completed data migrations
+col_index_jobs = db["index_jobs"]  # Checkpoints of channel indexing jobs
+col_broadcasts = db["broadcasts"]  # State of broadcast jobs
+col_leases = db["leases"]          # Shard and leader leases of running workers
+col_signals = db["signals"]        # Requests from one worker to the others
+col_stats = db["stats"]            # Precomputed statistics snapshots
+
+# Search results keyed by (query tokens, max_results). auto_filter and the
+# result callbacks run the same search back to back, so they share entries.
+search_cache = TTLCache(max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+# Fields each kind of caller reads, so result lists don't carry whole documents
+LISTING_FIELDS = {"file_name": 1, "quality": 1}
+DELIVERY_FIELDS = {"file_id": 1, "file_type": 1, "caption": 1}
+
+# Server error code of a write rejected by a unique index (E11000)
+DUPLICATE_KEY = 11000
+
+# Ranking: how much of a file name the query covers counts most, then quality
+# (best first, as in QUALITIES), then how recently the file was indexed
+RANK_MATCH_WEIGHT = 3
+QUALITY_WEIGHTS = {quality: 1 - index / len(QUALITIES) for index, quality in enumerate(QUALITIES)}
+RECENCY_HALF_LIFE_DAYS = 30
+
+# Searches running right now, by cache key. During a burst of one title every
+# caller waits for the same query instead of sending its own.
+search_flights = SingleFlight()
+
+# User profiles by user_id, kept in step with every write below. An empty
+# dict records that the user has no profile, which saves a lookup as well.
+profile_cache = TTLCache(max_entries=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+# The answer of /stats, which anyone can send, shared for STATS_CACHE_TTL
+stats_cache = TTLCache(max_entries=1, ttl=STATS_CACHE_TTL)
+
+# Whether a migration has finished, rechecked every minute while it hasn't
+migration_cache = TTLCache(max_entries=16, ttl=60)
+
+def timed_query(func):
+    """Record the duration of a database helper under its own name"""
+    return timed(DB_QUERY_SECONDS, helper=func.__name__)(func)
+
+@timed_query
+async def pending_migrations(names: Iterable[str]) -> list:
+    """Return the given migrations that have not been run yet"""
+    done = {doc["_id"] async for doc in col_migrations.find({"_id": {"$in": list(names)}})}
+    return [name for name in names if name not in done]
+
+async def migration_done(name: str) -> bool:
+    """Whether a migration has finished, as seen by any worker"""
+    done = migration_cache.get(name)
+    if done is None:
+        done = not await pending_migrations([name])
+        # Once finished it stays finished
+        migration_cache.set(name, done, ttl=float("inf") if done else None)
+    return done
+
+async def ping_database() -> float:
+    """Round trip a ping to MongoDB and return its latency in seconds"""
+    start = time.perf_counter()
+    await mongo_client.admin.command("ping")
+    return time.perf_counter() - start
+
+# Files
+def file_document(chat_id: int, file_id: str, file_name: str, file_type: str, caption: str = "",
+                  file_unique_id: str = "", file_size: int = 0) -> dict:
+    """Build the stored representation of an indexed file"""
+    return {
+        "chat_id": chat_id,
+        "file_id": file_id,
+        "file_unique_id": file_unique_id,
+        "file_name": file_name,
+        "file_type": file_type,
+        # quality, source, codec, year, season, episode, languages, file_size
+        **parse_filename(file_name, file_size),
+        "meta_version": METADATA_VERSION,
+        "caption": caption,
+        "tokens": tokenize(file_name),
+        "timestamp": datetime.now()
+    }
+
+def duplicate_key(doc: dict) -> dict:
+    """Filter matching every stored copy of a file
+
+    Telegram keeps a file's file_unique_id however often it is forwarded or
+    reposted, in any channel. Copies are only treated as one file when
+    their sizes agree as well. Files indexed before sizes were stored have
+    a file_size of 0 and match a copy of any size.
+    """
+    size = doc.get("file_size", 0)
+    return {"file_unique_id": doc["file_unique_id"], "file_size": {"$in": [size, 0]} if size else 0}
+
+@timed_query
+async def save_file(chat_id: int, file_id: str, file_name: str, file_type: str, caption: str = "",
+                    file_unique_id: str = "", file_size: int = 0) -> bool:
+    """Save file to database with parsed release metadata
+
+    Reposts and forwards of a file that is already indexed are skipped.
+    Returns whether the file was new.
+    """
+    doc = file_document(chat_id, file_id, file_name, file_type, caption, file_unique_id, file_size)
+    if file_unique_id:
+        try:
+            result = await col_files.update_one(duplicate_key(doc), {"$setOnInsert": doc}, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent upsert of the same file inserted it first
+            return False
+        if result.upserted_id is None:
+            return False
+    else:
+        await col_files.insert_one(doc)
+    await update_token_stats(Counter(doc["tokens"]))
+    invalidate_search_cache([doc["tokens"]])
+    return True
+
+@timed_query
+async def save_files_bulk(docs: list) -> tuple:
+    """Upsert a batch of file documents keyed on file_unique_id and size
+
+    Files already present are left untouched. Returns the number of newly
+    inserted files and the number of duplicates skipped.
+    """
+    unique = list({(doc["file_unique_id"], doc.get("file_size", 0)): doc for doc in docs}.values())
+    if not unique:
+        return 0, len(docs)
+    ops = [UpdateOne(duplicate_key(doc), {"$setOnInsert": doc}, upsert=True) for doc in unique]
+    try:
+        upserted = (await col_files.bulk_write(ops, ordered=False)).upserted_ids
+    except BulkWriteError as e:
+        # Files a concurrent upsert inserted first are duplicates; the rest of the batch was written
+        if e.details.get("writeConcernErrors") or any(
+            error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]
+        ):
+            raise
+        upserted = {item["index"]: item["_id"] for item in e.details["upserted"]}
+    inserted = [unique[index] for index in upserted]
+    
+    frequency = Counter()
+    for doc in inserted:
+        frequency.update(doc["tokens"])
+    await update_token_stats(frequency)
+    invalidate_search_cache([doc["tokens"] for doc in inserted])
+    return len(inserted), len(docs) - len(inserted)
+
+@timed_query
+async def update_token_stats(frequency: Dict[str, int]):
+    """Add to the document frequency of each token
+
+    New tokens also get their trigrams, which index the vocabulary for
+    typo-tolerant lookups.
+    """
+    ops = [
+        UpdateOne(
+            {"_id": token},
+            {"$inc": {"df": n}, "$setOnInsert": {"trigrams": trigrams(token), "len": len(token)}},
+            upsert=True
+        )
+        for token, n in frequency.items()
+    ]
+    if ops:
+        await col_tokens.bulk_write(ops, ordered=False)
+
+@timed_query
+async def plan_search(query: str) -> Optional[dict]:
+    """Build an index-backed file query, or None if nothing can match
+
+    Every query token must be present in the file's token list. Tokens are
+    ordered rarest first so the index scan starts from the shortest posting
+    list, and a query containing a token that was never indexed is answered
+    without touching col_files at all. The last token is matched as a prefix
+    when it is not a complete token, so results show up while a title is
+    still being typed.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    frequency = {doc["_id"]: doc["df"] async for doc in col_tokens.find({"_id": {"$in": tokens}})}
+    exact = sorted((t for t in tokens if frequency.get(t, 0) > 0), key=frequency.get)
+    missing = [t for t in tokens if frequency.get(t, 0) <= 0]
+
+    prefix = None
+    if missing:
+        if missing != [tokens[-1]] or len(tokens[-1]) < 2:
+            return None
+        prefix = {"tokens": {"$regex": "^" + re.escape(tokens[-1])}}
+
+    if exact and prefix:
+        return {"$and": [{"tokens": {"$all": exact}}, prefix]}
+    return prefix or {"tokens": {"$all": exact}}
+
+@timed_query
+async def suggest_token(token: str, min_similarity: float = 0.4) -> Optional[str]:
+    """Find the indexed token closest to a misspelled one
+
+    Candidates share at least one trigram with ``token`` and have a similar
+    length; they come from the trigram index over the token vocabulary, which
+    is far smaller than col_files. The best candidate by trigram similarity,
+    then by document frequency, wins.
+    """
+    if len(token) < 3:
+        return None
+    grams = trigrams(token)
+    cursor = await col_tokens.aggregate([
+        {"$match": {"trigrams": {"$in": grams}, "len": {"$gte": len(token) - 2, "$lte": len(token) + 2}}},
+        {"$project": {"df": 1, "shared": {"$size": {"$setIntersection": ["$trigrams", grams]}}}},
+        {"$sort": {"shared": -1, "df": -1}},
+        {"$limit": 20},
+    ])
+    candidates = [(similarity(token, doc["_id"]), doc["df"], doc["_id"]) async for doc in cursor]
+    if not candidates:
+        return None
+    score, _, best = max(candidates)
+    return best if score >= min_similarity else None
+
+@timed_query
+async def correct_query(query: str) -> Optional[str]:
+    """Rewrite a query with unknown tokens replaced by their closest indexed tokens
+
+    Returns None when every token is already known (or a known prefix, for
+    the last one) or when some token has no close match.
+    """
+    tokens = tokenize(query)
+    known = {doc["_id"] async for doc in col_tokens.find({"_id": {"$in": tokens}}, {"_id": 1})}
+    corrected = []
+    changed = False
+    for index, token in enumerate(tokens):
+        if token in known:
+            corrected.append(token)
+            continue
+        if index == len(tokens) - 1 and await col_tokens.find_one({"_id": {"$regex": "^" + re.escape(token)}}, {"_id": 1}):
+            corrected.append(token)
+            continue
+        suggestion = await suggest_token(token)
+        if suggestion is None:
+            return None
+        corrected.append(suggestion)
+        changed = True
+    return " ".join(corrected) if changed else None
+
+def ranking_stages(token_count: int) -> list:
+    """Aggregation stages that score matching files and sort them best first
+
+    The score adds the share of a file's tokens the query covers (so
+    "Avatar 2009" ranks the plain release above "Avatar Making Of"), the
+    quality weight and a recency term that falls to half after
+    RECENCY_HALF_LIFE_DAYS.
+    """
+    name_tokens = {"$max": [{"$size": {"$ifNull": ["$tokens", []]}}, token_count, 1]}
+    age_days = {"$divide": [
+        {"$subtract": ["$$NOW", {"$ifNull": ["$timestamp", datetime(2000, 1, 1)]}]}, 86400000
+    ]}
+    return [
+        {"$addFields": {"score": {"$add": [
+            {"$multiply": [RANK_MATCH_WEIGHT, {"$divide": [token_count, name_tokens]}]},
+            {"$switch": {
+                "branches": [{"case": {"$eq": ["$quality", q]}, "then": w} for q, w in QUALITY_WEIGHTS.items()],
+                "default": 0,
+            }},
+            {"$divide": [RECENCY_HALF_LIFE_DAYS, {"$add": [RECENCY_HALF_LIFE_DAYS, age_days]}]},
+        ]}}},
+        {"$sort": {"score": -1, "_id": -1}},
+    ]
+
+@timed_query
+async def search_files(query: str, max_results: int = 50, filters: Optional[dict] = None,
+                       projection: Optional[dict] = None) -> list:
+    """Search files by query, best matches first
+
+    Results can be restricted by metadata fields with ``filters`` and
+    reduced to the fields a caller needs with ``projection``; scoring,
+    sorting, limiting and projecting all happen on the server.
+    """
+    tokens = tokenize(query)
+    key = (
+        tuple(tokens), max_results, tuple(sorted((filters or {}).items())),
+        tuple(sorted(projection)) if projection else None
+    )
+    results = search_cache.get(key)
+    if results is not None:
+        return results
+
+    async def search() -> list:
+        plan = await plan_search(query)
+        if plan is None:
+            results = []
+        else:
+            pipeline = [{"$match": {**plan, **(filters or {})}}, *ranking_stages(len(tokens)), {"$limit": max_results}]
+            if projection:
+                pipeline.append({"$project": projection})
+            cursor = await col_files.aggregate(pipeline)
+            results = await cursor.to_list(None)
+        # A file saved meanwhile may be missing from these results
+        if search_flights.is_current(key):
+            search_cache.set(key, results)
+        return results
+
+    return await search_flights.do(key, search)
+
+@timed_query
+async def search_facets(query: str, field: str = "quality") -> Dict[str, int]:
+    """Count every file matching a query by the value of a metadata field"""
+    key = (tuple(tokenize(query)), "facets", field)
+    facets = search_cache.get(key)
+    if facets is not None:
+        return facets
+
+    async def count() -> Dict[str, int]:
+        plan = await plan_search(query)
+        facets = {}
+        if plan is not None:
+            cursor = await col_files.aggregate([
+                {"$match": plan},
+                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            ])
+            facets = {str(doc["_id"]): doc["count"] async for doc in cursor}
+        if search_flights.is_current(key):
+            search_cache.set(key, facets)
+        return facets
+
+    return await search_flights.do(key, count)
+
+def invalidate_search_cache(files_tokens: List[List[str]]) -> int:
+    """Drop cached and in-flight searches newly stored files could now appear in
+
+    A cached query is affected when each of its tokens is a prefix of one of
+    a file's tokens, which covers both exact and prefix matches. The tokens
+    of a whole batch of files are checked together, so a query whose tokens
+    are spread over several of the files is dropped as well; that costs a
+    cache miss, while checking every query against every file of an /index
+    chunk would hold up the event loop.
+    """
+    if not files_tokens or not (len(search_cache) or search_flights.stats()["in_flight"]):
+        return 0
+
+    tokens = sorted({token for file_tokens in files_tokens for token in file_tokens})
+    matches: Dict[str, bool] = {}
+
+    def prefix_of_any(query_token: str) -> bool:
+        if query_token not in matches:
+            index = bisect_left(tokens, query_token)
+            matches[query_token] = index < len(tokens) and tokens[index].startswith(query_token)
+        return matches[query_token]
+
+    def affected(key) -> bool:
+        return all(prefix_of_any(q) for q in key[0])
+
+    # Searches already running may have missed the files, so later callers must not join them
+    search_flights.forget(affected)
+    return search_cache.invalidate(affected)
+
+@timed_query
+async def get_files_by_ids(ids: list, projection: Optional[dict] = None) -> list:
+    """Fetch files by _id, preserving the order of ``ids``"""
+    docs = {doc["_id"]: doc async for doc in col_files.find({"_id": {"$in": ids}}, projection)}
+    return [docs[_id] for _id in ids if _id in docs]
+
+@timed_query
+async def count_files() -> int:
+    """Count indexed files from collection metadata, without scanning"""
+    return await col_files.estimated_document_count()
+
+# Manual filters
+@timed_query
+async def add_filter(chat_id: int, keyword: str, file_id: str, caption: str = ""):
+    """Add manual filter"""
+    await col_filters.update_one(
+        {"chat_id": chat_id, "keyword": keyword.lower()},
+        {"$set": {"file_id": file_id, "caption": caption}},
+        upsert=True
+    )
+    filter_index.set(chat_id, {"chat_id": chat_id, "keyword": keyword.lower(), "file_id": file_id, "caption": caption})
+
+@timed_query
+async def get_filter(chat_id: int, text: str) -> Optional[dict]:
+    """Get the manual filter whose keyword appears in ``text``, preferring the longest"""
+    return await filter_index.match(chat_id, text)
+
+@timed_query
+async def get_all_filters(chat_id: int) -> list:
+    """Get all manual filters for a chat"""
+    return await col_filters.find({"chat_id": chat_id}).to_list(None)
+
+@timed_query
+async def delete_filter(chat_id: int, keyword: str) -> bool:
+    """Delete manual filter"""
+    result = await col_filters.delete_one({"chat_id": chat_id, "keyword": keyword.lower()})
+    filter_index.remove(chat_id, keyword.lower())
+    return result.deleted_count > 0
+
+@timed_query
+async def delete_all_filters(chat_id: int) -> int:
+    """Delete all manual filters for a chat"""
+    result = await col_filters.delete_many({"chat_id": chat_id})
+    filter_index.clear(chat_id)
+    return result.deleted_count
+
+@timed_query
+async def count_filters() -> int:
+    """Count manual filters from collection metadata, without scanning"""
+    return await col_filters.estimated_document_count()
+
+# Every chat's filters compiled into one matcher, loaded on first use
+filter_index = FilterIndex(get_all_filters, max_chats=FILTER_CACHE_CHATS, ttl=FILTER_CACHE_TTL)
+
+# Users
+@timed_query
+async def get_profile(user_id: int) -> dict:
+    """Get a user's profile, or an empty dict for unknown users"""
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        profile = await col_users.find_one({"user_id": user_id}, {"_id": 0}) or {}
+        if not await migration_done("profiles"):
+            profile = {**await get_legacy_profile(user_id), **profile}
+        profile_cache.set(user_id, profile)
+    return profile
+
+async def get_legacy_profile(user_id: int) -> dict:
+    """Thumbnails and caption saved before profiles existed, until the profiles migration merges them"""
+    legacy = {}
+    async for doc in col_thumb.find({"user_id": user_id}):
+        legacy[_thumb_field(doc.get("is_lazy", False))] = doc.get("thumb_id")
+    settings = await col_settings.find_one({"user_id": user_id})
+    if settings and settings.get("caption") is not None:
+        legacy["caption"] = settings["caption"]
+    return legacy
+
+@timed_query
+async def update_profile(user_id: int, set_fields: Optional[dict] = None, unset_fields: Iterable[str] = ()) -> bool:
+    """Write profile fields through to the database and the cache
+
+    Returns whether an existing profile changed.
+    """
+    update = {}
+    if set_fields:
+        update["$set"] = set_fields
+    if unset_fields:
+        update["$unset"] = {field: "" for field in unset_fields}
+    result = await col_users.update_one({"user_id": user_id}, update, upsert=bool(set_fields))
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        profile = {**profile, "user_id": user_id, **(set_fields or {})}
+        for field in unset_fields:
+            profile.pop(field, None)
+        profile_cache.set(user_id, profile)
+    return result.modified_count > 0
+
+@timed_query
+async def add_user(user_id: int, username: str = ""):
+    """Add or refresh a bot user, skipping the write when nothing changed
+
+    With several workers the cached profile can't be trusted: the leader's
+    broadcasts flag users as blocked in the database without touching other
+    workers' caches, so every call writes.
+    """
+    profile = await get_profile(user_id) if SHARD_COUNT == 1 else None
+    if profile and profile.get("username") == username and profile.get("blocked") is False:
+        return
+    await col_users.update_one(
+        {"user_id": user_id},
+        {"$set": {"username": username, "blocked": False}, "$setOnInsert": {"first_seen": datetime.now()}},
+        upsert=True
+    )
+    profile_cache.pop(user_id)
+
+@timed_query
+async def count_users() -> int:
+    """Count bot users from collection metadata, without scanning"""
+    return await col_users.estimated_document_count()
+
+@timed_query
+async def get_reachable_users(after_user_id: Optional[int] = None, limit: int = 1000) -> list:
+    """Get the next batch of users not known to have blocked the bot, by user_id"""
+    query = {"blocked": {"$ne": True}}
+    if after_user_id is not None:
+        query["user_id"] = {"$gt": after_user_id}
+    return await col_users.find(query, {"user_id": 1}).sort("user_id", 1).limit(limit).to_list(None)
+
+@timed_query
+async def count_reachable_users() -> int:
+    """Count users not known to have blocked the bot"""
+    return await col_users.count_documents({"blocked": {"$ne": True}})
+
+@timed_query
+async def mark_users_blocked(user_ids: list):
+    """Flag users that blocked the bot or were deactivated"""
+    if user_ids:
+        await col_users.update_many({"user_id": {"$in": user_ids}}, {"$set": {"blocked": True}})
+        for user_id in user_ids:
+            profile_cache.pop(user_id)
+
+# Thumbnails and captions
+def _thumb_field(is_lazy: bool) -> str:
+    return "lazy_thumb_id" if is_lazy else "thumb_id"
+
+@timed_query
+async def save_thumbnail(user_id: int, thumb_id: str, is_lazy: bool = False):
+    """Save thumbnail for renaming feature"""
+    await update_profile(user_id, {_thumb_field(is_lazy): thumb_id})
+
+@timed_query
+async def get_thumbnail(user_id: int, is_lazy: bool = False) -> Optional[str]:
+    """Get thumbnail for renaming feature"""
+    return (await get_profile(user_id)).get(_thumb_field(is_lazy))
+
+@timed_query
+async def delete_thumbnail(user_id: int, is_lazy: bool = False) -> bool:
+    """Delete thumbnail"""
+    deleted = await update_profile(user_id, unset_fields=[_thumb_field(is_lazy)])
+    if not await migration_done("profiles"):
+        # Or the fallback, and later the migration, would bring it back
+        result = await col_thumb.delete_many({"user_id": user_id, "is_lazy": True if is_lazy else {"$ne": True}})
+        deleted = deleted or result.deleted_count > 0
+    return deleted
+
+@timed_query
+async def save_caption(user_id: int, caption: str):
+    """Save custom caption"""
+    await update_profile(user_id, {"caption": caption})
+
+@timed_query
+async def get_caption(user_id: int) -> Optional[str]:
+    """Get custom caption"""
+    return (await get_profile(user_id)).get("caption")
+
+@timed_query
+async def delete_caption(user_id: int) -> bool:
+    """Delete custom caption"""
+    deleted = await update_profile(user_id, unset_fields=["caption"])
+    if not await migration_done("profiles"):
+        # Or the fallback, and later the migration, would bring it back
+        result = await col_settings.delete_many({"user_id": user_id})
+        deleted = deleted or result.deleted_count > 0
+    return deleted
+
+# Channel indexing jobs
+@timed_query
+async def get_index_job(chat_id: int) -> Optional[dict]:
+    """Get the indexing checkpoint of a channel"""
+    return await col_index_jobs.find_one({"_id": chat_id})
+
+@timed_query
+async def save_index_job(job: dict):
+    """Persist an indexing checkpoint"""
+    job["updated_at"] = datetime.now()
+    await col_index_jobs.replace_one({"_id": job["_id"]}, job, upsert=True)
+
+@timed_query
+async def get_unfinished_index_jobs() -> list:
+    """Get indexing jobs that were interrupted before completing"""
+    return await col_index_jobs.find({"status": "running"}).to_list(None)
+
+# Broadcast jobs
+@timed_query
+async def create_broadcast(job: dict) -> dict:
+    """Store a new broadcast job"""
+    job["updated_at"] = datetime.now()
+    result = await col_broadcasts.insert_one(job)
+    job["_id"] = result.inserted_id
+    return job
+
+@timed_query
+async def save_broadcast(job: dict):
+    """Persist broadcast progress"""
+    job["updated_at"] = datetime.now()
+    await col_broadcasts.replace_one({"_id": job["_id"]}, job)
+
+@timed_query
+async def get_unfinished_broadcasts() -> list:
+    """Get broadcasts that were interrupted before completing"""
+    return await col_broadcasts.find({"status": "running"}).to_list(None)
+
+# Cross-worker signals
+@timed_query
+async def send_signal(name: str):
+    """Record a request, such as cancelling jobs, for whichever worker acts on it"""
+    await col_signals.update_one({"_id": name}, {"$set": {"sent_at": datetime.now()}}, upsert=True)
+
+@timed_query
+async def get_signals() -> Dict[str, datetime]:
+    """Get the time each signal was last sent"""
+    return {doc["_id"]: doc["sent_at"] async for doc in col_signals.find({})}
+
+# Statistics
+@timed_query
+async def refresh_stats(growth_days: int = 30) -> dict:
+    """Recompute the file breakdowns and store them as one snapshot
+
+    Counts files per quality, per type and per channel (top 10), and files
+    added per day over the last ``growth_days``. This scans col_files, so it
+    runs in the background and /stats only reads the stored snapshot.
+    """
+    since = datetime.now() - timedelta(days=growth_days)
+    by_count = {"$sort": {"count": -1}}
+    cursor = await col_files.aggregate([
+        {"$facet": {
+            "quality": [{"$group": {"_id": "$quality", "count": {"$sum": 1}}}, by_count],
+            "file_type": [{"$group": {"_id": "$file_type", "count": {"$sum": 1}}}, by_count],
+            "channels": [{"$group": {"_id": "$chat_id", "count": {"$sum": 1}}}, by_count, {"$limit": 10}],
+            "growth": [
+                {"$match": {"timestamp": {"$gte": since}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}, "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }}
+    ], allowDiskUse=True)
+    facets = (await cursor.to_list(1))[0]
+    snapshot = {
+        "_id": "files",
+        "computed_at": datetime.now(),
+        # Lists of [value, count], since quality or chat ids aren't safe as field names
+        **{name: [[row["_id"], row["count"]] for row in rows] for name, rows in facets.items()},
+    }
+    await col_stats.replace_one({"_id": "files"}, snapshot, upsert=True)
+    stats_cache.clear()
+    return snapshot
+
+@timed_query
+async def get_stats() -> dict:
+    """Approximate totals and the latest breakdown snapshot, cached for STATS_CACHE_TTL"""
+    stats = stats_cache.get("stats")
+    if stats is None:
+        files, filters, users, snapshot = await asyncio.gather(
+            count_files(), count_filters(), count_users(), col_stats.find_one({"_id": "files"})
+        )
+        stats = {"files": files, "filters": filters, "users": users, "snapshot": snapshot}
+        stats_cache.set("stats", stats)
+    return stats
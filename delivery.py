@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Set
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.types import InputMediaAudio, InputMediaDocument, InputMediaVideo
+
+from cache import TTLCache
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram albums hold at most 10 items, and documents and audio can only
+# be grouped with their own kind
+MEDIA_GROUP_SIZE = 10
+INPUT_MEDIA = {
+    "document": InputMediaDocument,
+    "video": InputMediaVideo,
+    "audio": InputMediaAudio,
+}
+
+
+class Deliverer:
+    """Send files to chats through fair, rate-limited per-chat queues
+
+    Each chat has its own queue and token bucket, and at most one send per
+    chat is in flight. ``concurrency`` workers serve the chats with pending
+    sends round-robin, so one user requesting many files cannot starve other
+    chats, and a chat's queue is capped at ``max_pending`` batches.
+    Consecutive files of the same type go out as media groups, and
+    FloodWait errors are waited out and retried.
+    """
+
+    def __init__(self, client: Client, concurrency: int = 8, chat_rate: float = 1.0, chat_burst: float = 3,
+                 max_pending: int = 10, max_retries: int = 3):
+        self.client = client
+        self.concurrency = concurrency
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._queues: Dict[int, Deque[tuple]] = {}
+        # Kept a while after a chat's queue drains so back-to-back requests share its limit
+        self._buckets = TTLCache(max_entries=10000, ttl=60)
+        self._ready: Deque[int] = deque()
+        self._active: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.rejected = 0
+        self.latencies: Deque[float] = deque(maxlen=1000)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @staticmethod
+    def batches(files: List[dict]) -> List[List[dict]]:
+        """Split files into runs of one type, at most one album each"""
+        batches: List[List[dict]] = []
+        for file in files:
+            last = batches[-1] if batches else None
+            groupable = file.get("file_type") in INPUT_MEDIA
+            if groupable and last and last[0].get("file_type") == file.get("file_type") and len(last) < MEDIA_GROUP_SIZE:
+                last.append(file)
+            else:
+                batches.append([file])
+        return batches
+
+    def deliver(self, chat_id: int, files: List[dict]) -> bool:
+        """Queue files for a chat and return at once; False if the chat's queue is full
+
+        Handlers must not wait for the sends: Pyrogram runs them on a small
+        pool of workers, and a chat limited to ``chat_rate`` would hold one
+        for seconds while every other chat's updates wait. A chat may have
+        at most ``max_pending`` batches queued; files past that are rejected
+        whole rather than sent in part.
+        """
+        self.start()
+        batches = self.batches(files)
+        if len(self._queues.get(chat_id, ())) + len(batches) > self.max_pending:
+            self.rejected += len(files)
+            return False
+        queue = self._queues.setdefault(chat_id, deque())
+        was_idle = chat_id not in self._active and chat_id not in self._ready
+        now = time.monotonic()
+        queue.extend((batch, now) for batch in batches)
+        if was_idle:
+            self._ready.append(chat_id)
+            self._wakeup.set()
+        return True
+
+    async def _work(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            chat_id = self._ready.popleft()
+            queue = self._queues.get(chat_id)
+            if not queue:
+                self._queues.pop(chat_id, None)
+                continue
+            self._active.add(chat_id)
+            batch, queued_at = queue.popleft()
+            try:
+                await self._send(chat_id, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning("Delivery to %s failed: %s", chat_id, e)
+            finally:
+                self.latencies.append(time.monotonic() - queued_at)
+                self._active.discard(chat_id)
+                # Back of the line, so every other waiting chat goes first
+                if queue:
+                    self._ready.append(chat_id)
+                    self._wakeup.set()
+                else:
+                    self._queues.pop(chat_id, None)
+
+    async def _send(self, chat_id: int, batch: List[dict]) -> int:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._buckets.set(chat_id, bucket)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                if len(batch) == 1:
+                    file = batch[0]
+                    await self.client.send_cached_media(
+                        chat_id=chat_id,
+                        file_id=file["file_id"],
+                        caption=file.get("caption", "")
+                    )
+                else:
+                    media_type = INPUT_MEDIA[batch[0]["file_type"]]
+                    await self.client.send_media_group(
+                        chat_id,
+                        [media_type(file["file_id"], caption=file.get("caption", "")) for file in batch]
+                    )
+                self.sent += len(batch)
+                return len(batch)
+            except FloodWait as e:
+                self.flood_waits += 1
+                if attempt == self.max_retries:
+                    break
+                await asyncio.sleep(e.value)
+        self.failed += len(batch)
+        return 0
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+            "rejected": self.rejected,
+            "queued_chats": len(self._queues),
+            "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+            "p99_latency": latencies[max(0, int(len(latencies) * 0.99) - 1)] if latencies else 0.0,
+        }
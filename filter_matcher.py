@@ -0,0 +1,151 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import TTLCache
+
+
+class AhoCorasick:
+    """Multi-keyword matcher that scans a text once for all keywords"""
+
+    def __init__(self, keywords: List[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword: str):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(keyword)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str):
+        """Yield (end_index, keyword) for every keyword occurrence in ``text``"""
+        node = 0
+        for index, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for keyword in self._out[node]:
+                yield index, keyword
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class ChatFilters:
+    """The manual filters of one chat, compiled into a single matcher"""
+
+    def __init__(self, filters: List[dict]):
+        self.filters: Dict[str, dict] = {f["keyword"]: f for f in filters}
+        self._matcher: Optional[AhoCorasick] = None
+
+    def set(self, fltr: dict):
+        self.filters[fltr["keyword"]] = fltr
+        self._matcher = None
+
+    def remove(self, keyword: str):
+        if self.filters.pop(keyword, None) is not None:
+            self._matcher = None
+
+    def match(self, text: str) -> Optional[dict]:
+        """Return the filter of the longest keyword found as whole words in ``text``"""
+        if not self.filters:
+            return None
+        if self._matcher is None:
+            self._matcher = AhoCorasick(list(self.filters))
+        text = text.lower()
+        best = None
+        for end, keyword in self._matcher.find(text):
+            start = end - len(keyword) + 1
+            if _is_boundary(text, start - 1) and _is_boundary(text, end + 1):
+                if best is None or len(keyword) > len(best):
+                    best = keyword
+        return self.filters[best] if best else None
+
+
+class FilterIndex:
+    """Per-chat manual filters kept in memory
+
+    A chat's filters are loaded from the database on its first message and
+    then kept in sync by the add/delete helpers, so matching a message costs
+    no database round trip. Idle chats are evicted after ``ttl`` seconds and
+    reloaded on demand.
+    """
+
+    def __init__(self, loader: Callable[[int], Awaitable[List[dict]]], max_chats: int = 10000, ttl: float = 3600):
+        self._loader = loader
+        self._chats = TTLCache(max_entries=max_chats, ttl=ttl)
+        self._loading: Dict[int, asyncio.Future] = {}
+
+    async def get(self, chat_id: int) -> ChatFilters:
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            return chat
+        # Concurrent first messages of a chat share one load
+        if chat_id not in self._loading:
+            self._loading[chat_id] = asyncio.ensure_future(self._load(chat_id))
+        return await asyncio.shield(self._loading[chat_id])
+
+    async def _load(self, chat_id: int) -> ChatFilters:
+        try:
+            chat = ChatFilters(await self._loader(chat_id))
+            self._chats.set(chat_id, chat)
+            return chat
+        finally:
+            self._loading.pop(chat_id, None)
+
+    async def match(self, chat_id: int, text: str) -> Optional[dict]:
+        return (await self.get(chat_id)).match(text)
+
+    def _discard_pending_load(self, chat_id: int):
+        # A load racing with a write may have read the old filters
+        loading = self._loading.get(chat_id)
+        if loading is not None:
+            loading.add_done_callback(lambda _: self._chats.pop(chat_id))
+
+    def set(self, chat_id: int, fltr: dict):
+        self._discard_pending_load(chat_id)
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            chat.set(fltr)
+
+    def remove(self, chat_id: int, keyword: str):
+        self._discard_pending_load(chat_id)
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            chat.remove(keyword)
+
+    def clear(self, chat_id: int):
+        self._discard_pending_load(chat_id)
+        self._chats.pop(chat_id)
+
+    def evict(self, predicate: Callable[[int], bool]) -> int:
+        """Forget every chat whose id matches ``predicate``"""
+        return self._chats.invalidate(predicate)
+
+    def stats(self) -> dict:
+        return self._chats.stats()
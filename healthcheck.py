@@ -1,18 +1,102 @@
-from flask import Flask
-import threading
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 
-app = Flask(__name__)
+import metrics
 
-@app.route('/')
-def health_check():
-    return "Bot is alive", 200
+logger = logging.getLogger(__name__)
 
-# ⚡ Pro Tip: Add this endpoint for better uptime monitoring
-@app.route('/ping')
-def ping():
-    return "pong", 200
+# A check returns (healthy, details) and must not take longer than this
+CHECK_TIMEOUT = 3
+# Requests are only a request line and a few headers
+MAX_HEADER_LINES = 100
+READ_TIMEOUT = 5
 
-def run_server():
-    app.run(host='0.0.0.0', port=8080)  # Must match Render's port
+REASONS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
 
-threading.Thread(target=run_server).start()
+Check = Callable[[], Awaitable[Tuple[bool, dict]]]
+
+
+class HealthServer:
+    """Liveness, readiness and metrics over HTTP, in the bot's own event loop
+
+    ``/`` and ``/ping`` answer as long as the loop is running. ``/ready``
+    runs every readiness check and answers 503 if any fails, with each
+    check's details as JSON. ``/metrics`` serves the Prometheus text format.
+    """
+
+    def __init__(self, checks: Dict[str, Check], host: str = "0.0.0.0", port: int = 8080):
+        self.checks = checks
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Health server listening on %s:%d", self.host, self.port)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def readiness(self) -> Tuple[bool, dict]:
+        """Run every check concurrently; a check that fails or times out is unhealthy"""
+        async def run(name: str, check: Check):
+            start = time.perf_counter()
+            try:
+                healthy, details = await asyncio.wait_for(check(), CHECK_TIMEOUT)
+            except Exception as e:
+                healthy, details = False, {"error": str(e) or type(e).__name__}
+            details["ok"] = healthy
+            details["check_seconds"] = round(time.perf_counter() - start, 4)
+            return name, details
+
+        results = dict(await asyncio.gather(*(run(name, check) for name, check in self.checks.items())))
+        return all(result["ok"] for result in results.values()), results
+
+    async def _route(self, method: str, path: str) -> Tuple[int, str, str]:
+        if method not in ("GET", "HEAD"):
+            return 405, "text/plain", "method not allowed"
+        if path == "/":
+            return 200, "text/plain", "Bot is alive"
+        if path == "/ping":
+            return 200, "text/plain", "pong"
+        if path == "/ready":
+            ready, results = await self.readiness()
+            return (200 if ready else 503), "application/json", json.dumps(results)
+        if path == "/metrics":
+            return 200, metrics.CONTENT_TYPE, metrics.render()
+        return 404, "text/plain", "not found"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            for _ in range(MAX_HEADER_LINES):
+                line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0], parts[1].split("?", 1)[0]
+            status, content_type, body = await self._route(method, path)
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            if method != "HEAD":
+                writer.write(payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.warning("Health request failed: %s", e)
+        finally:
+            writer.close()
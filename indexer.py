@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.types import Message
+
+from database import file_document, get_index_job, save_files_bulk, save_index_job
+from jobs import CheckpointedJob
+
+logger = logging.getLogger(__name__)
+
+# Bots cannot read chat history directly, so messages are fetched by id in
+# chunks of the largest size get_messages accepts.
+FETCH_CHUNK = 200
+
+
+def extract_file(message: Message) -> Optional[dict]:
+    """Return the indexable fields of a channel post, or None"""
+    if not message or message.empty:
+        return None
+
+    for file_type in ("document", "video", "audio"):
+        media = getattr(message, file_type, None)
+        if media:
+            return {
+                "file_id": media.file_id,
+                "file_unique_id": media.file_unique_id,
+                "file_name": media.file_name or "",
+                "file_type": file_type,
+                "file_size": media.file_size or 0,
+                "caption": message.caption or "",
+            }
+    return None
+
+
+class ChannelIndexer(CheckpointedJob):
+    """Backfill a channel's history into col_files
+
+    Message ids are fetched in chunks of ``FETCH_CHUNK`` with up to
+    ``concurrency`` requests in flight, written with one unordered bulk
+    upsert per chunk, and checkpointed after every chunk so an interrupted
+    job resumes from the last written message id.
+    """
+
+    def __init__(self, client: Client, chat_id: int, last_msg_id: int, status: Optional[Message] = None,
+                 concurrency: int = 3, progress_interval: float = 10):
+        super().__init__(status, progress_interval)
+        self.client = client
+        self.chat_id = chat_id
+        self.last_msg_id = last_msg_id
+        self.concurrency = concurrency
+        self._started = 0.0
+        self._start_id = 0
+
+    @property
+    def name(self) -> str:
+        return f"Indexing {self.chat_id}"
+
+    async def save(self):
+        await save_index_job(self.job)
+
+    async def load(self):
+        """Resume from a stored checkpoint, or start a new job"""
+        job = await get_index_job(self.chat_id)
+        if job and job.get("status") == "running":
+            job["last_msg_id"] = max(job["last_msg_id"], self.last_msg_id)
+            self.job = job
+        else:
+            # Previous runs already covered everything before their next_id
+            self.job = {
+                "_id": self.chat_id,
+                "status": "running",
+                "next_id": job["next_id"] if job else 1,
+                "last_msg_id": self.last_msg_id,
+                "indexed": 0,
+                "duplicates": 0,
+                "skipped": 0,
+                "started_at": datetime.now(),
+            }
+        if self.status:
+            self.job["status_chat_id"] = self.status.chat.id
+            self.job["status_message_id"] = self.status.id
+        await save_index_job(self.job)
+
+    async def fetch(self, first_id: int) -> List[Message]:
+        """Fetch one chunk of messages, waiting out flood limits"""
+        ids = list(range(first_id, min(first_id + FETCH_CHUNK, self.job["last_msg_id"] + 1)))
+        while True:
+            try:
+                messages = await self.client.get_messages(self.chat_id, ids)
+                return messages if isinstance(messages, list) else [messages]
+            except FloodWait as e:
+                logger.warning("Indexing %s: FloodWait %ss", self.chat_id, e.value)
+                await asyncio.sleep(e.value)
+
+    async def write(self, messages: List[Message]):
+        """Extract metadata from one chunk and bulk upsert it"""
+        docs = []
+        for message in messages:
+            fields = extract_file(message)
+            if fields:
+                docs.append(file_document(self.chat_id, **fields))
+        self.job["skipped"] += len(messages) - len(docs)
+        if docs:
+            inserted, duplicates = await save_files_bulk(docs)
+            self.job["indexed"] += inserted
+            self.job["duplicates"] += duplicates
+
+    async def run(self) -> dict:
+        """Index the channel up to ``last_msg_id`` and return the final job"""
+        if not self.job:
+            await self.load()
+        self._started = time.monotonic()
+        self._start_id = self.job["next_id"]
+
+        starts = range(self.job["next_id"], self.job["last_msg_id"] + 1, FETCH_CHUNK)
+        pending = [asyncio.ensure_future(self.fetch(first)) for first in starts[:self.concurrency]]
+        queued = iter(starts[self.concurrency:])
+        try:
+            while pending and not self.cancelled:
+                messages = await pending.pop(0)
+                first = next(queued, None)
+                if first is not None:
+                    pending.append(asyncio.ensure_future(self.fetch(first)))
+
+                await self.write(messages)
+                self.job["next_id"] = min(self.job["next_id"] + FETCH_CHUNK, self.job["last_msg_id"] + 1)
+                await save_index_job(self.job)
+                await self.report()
+        except Exception as e:
+            await self.fail(e)
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+
+        await self.finish()
+        return self.job
+
+    def rate(self) -> float:
+        """Messages processed per minute in this run"""
+        elapsed = time.monotonic() - self._started
+        return (self.job["next_id"] - self._start_id) / elapsed * 60 if elapsed else 0.0
+
+    def progress_text(self, final: bool = False) -> str:
+        job = self.job
+        done = job["next_id"] - 1
+        total = job["last_msg_id"]
+        rate = self.rate()
+        remaining = (total - done) / rate if rate else 0
+        title = {
+            "done": "✅ Indexing completed",
+            "cancelled": "⛔ Indexing cancelled",
+            "failed": f"❌ Indexing failed: `{job.get('error')}`",
+        }.get(job["status"], "🔍 Indexing")
+        text = (
+            f"{title}\n\n"
+            f"• Messages: `{done}/{total}`\n"
+            f"• Indexed: `{job['indexed']}`\n"
+            f"• Duplicates: `{job['duplicates']}`\n"
+            f"• Skipped (no media): `{job['skipped']}`\n"
+            f"• Speed: `{rate:.0f}` messages/min"
+        )
+        if not final:
+            text += f"\n• ETA: `{remaining:.1f}` min"
+        return text
@@ -0,0 +1,74 @@
+import abc
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointedJob(abc.ABC):
+    """Status reporting and final states shared by the leader's resumable jobs
+
+    A job is a dict persisted by ``save`` whose ``status`` stays "running"
+    until it ends, so the leader resumes it from its last checkpoint after a
+    restart. Progress is shown by editing an optional status message at most
+    once per ``progress_interval`` seconds.
+    """
+
+    def __init__(self, status: Optional[Message] = None, progress_interval: float = 10):
+        self.job: dict = {}
+        self.status = status
+        self.progress_interval = progress_interval
+        self.cancelled = False
+        self._last_progress = 0.0
+
+    @property
+    @abc.abstractmethod
+    def name(self) -> str:
+        """How the job appears in logs"""
+
+    @abc.abstractmethod
+    async def save(self):
+        """Persist the job document"""
+
+    @abc.abstractmethod
+    def progress_text(self, final: bool = False) -> str:
+        """Text of the status message"""
+
+    async def finish(self):
+        """Record that the job ran to its end or was cancelled"""
+        self.job["status"] = "cancelled" if self.cancelled else "done"
+        self.job["finished_at"] = datetime.now()
+        await self.save()
+        await self.report(final=True)
+
+    async def fail(self, error: Exception):
+        """Record a permanent error, such as losing access to a channel, so the leader doesn't restart the job
+
+        Cancellation (losing the leader lease) is not an Exception and never
+        gets here, so the job stays running for the next leader.
+        """
+        self.job["status"] = "failed"
+        self.job["error"] = str(error) or type(error).__name__
+        self.job["finished_at"] = datetime.now()
+        await self.save()
+        await self.report(final=True)
+
+    async def report(self, final: bool = False):
+        """Edit the status message, at most once per progress interval"""
+        now = time.monotonic()
+        if not self.status or (not final and now - self._last_progress < self.progress_interval):
+            return
+        self._last_progress = now
+        try:
+            await self.status.edit_text(self.progress_text(final))
+        except MessageNotModified:
+            pass
+        except FloodWait as e:
+            logger.warning("%s: progress update throttled for %ss", self.name, e.value)
+        except Exception as e:
+            logger.warning("%s: could not update progress: %s", self.name, e)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limit for one text message
+MAX_MESSAGE_LENGTH = 4096
+
+
+class LogSink:
+    """Non-blocking, batched delivery of log channel messages
+
+    ``put`` only appends to a bounded queue, so handlers never wait on the
+    Telegram API. A background task sends at most one digest per
+    ``flush_interval``, packing as many queued entries as fit in one
+    message. When the queue is full the oldest entries are dropped and the
+    next digest says how many were lost. ``close`` flushes what is left.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable], max_queue: int = 1000, flush_interval: float = 5):
+        self._send = send
+        self._queue: deque = deque()
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.sent = 0
+        self._unreported_drops = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def put(self, text: str):
+        """Queue a log entry without waiting"""
+        if self._closing:
+            return
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+            self._unreported_drops += 1
+        self._queue.append(text[:MAX_MESSAGE_LENGTH])
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def _digest(self) -> str:
+        """Pop as many entries as fit into one message"""
+        parts = []
+        length = 0
+        if self._unreported_drops:
+            parts.append(f"⚠️ {self._unreported_drops} log messages dropped (queue full)")
+            length = len(parts[0])
+            self._unreported_drops = 0
+        while self._queue:
+            entry = self._queue[0]
+            extra = len(entry) + (2 if parts else 0)
+            if parts and length + extra > MAX_MESSAGE_LENGTH:
+                break
+            parts.append(self._queue.popleft())
+            length += extra
+        return "\n\n".join(parts)
+
+    async def _flush_once(self):
+        text = self._digest()
+        if not text:
+            return
+        while True:
+            try:
+                await self._send(text)
+                self.sent += 1
+                return
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                logger.warning("Could not send to log channel: %s", e)
+                return
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue or self._unreported_drops:
+                await self._flush_once()
+                await asyncio.sleep(self.flush_interval)
+
+    async def close(self, timeout: float = 30):
+        """Stop accepting entries and send everything still queued"""
+        self._closing = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropped %d log messages on shutdown", len(self._queue))
+
+    async def _drain(self):
+        while self._queue or self._unreported_drops:
+            await self._flush_once()
+
+    def stats(self) -> dict:
+        return {"queued": len(self._queue), "sent": self.sent, "dropped": self.dropped}
@@ -0,0 +1,95 @@
+import re
+from typing import Dict, Optional
+
+# Bump when the parser changes so the backfill migration re-parses old files
+METADATA_VERSION = 1
+
+QUALITIES = ("2160p", "1440p", "1080p", "720p", "576p", "540p", "480p", "360p")
+
+_SOURCES = {
+    "bluray": "BluRay", "blu ray": "BluRay", "bdrip": "BluRay", "brrip": "BluRay", "bdremux": "BluRay",
+    "web dl": "WEB-DL", "webdl": "WEB-DL", "webrip": "WEBRip", "web": "WEB-DL",
+    "hdrip": "HDRip", "dvdrip": "DVDRip", "dvdscr": "DVDScr", "hdtv": "HDTV",
+    "hdcam": "CAM", "camrip": "CAM", "cam": "CAM", "hdts": "TS", "telesync": "TS", "predvd": "PreDVD",
+}
+_CODECS = {
+    "x264": "x264", "h264": "x264", "h 264": "x264", "avc": "x264",
+    "x265": "x265", "h265": "x265", "h 265": "x265", "hevc": "x265",
+    "av1": "AV1", "xvid": "XviD", "divx": "DivX",
+}
+_LANGUAGES = {
+    "hindi": "Hindi", "hin": "Hindi", "english": "English", "eng": "English",
+    "tamil": "Tamil", "tam": "Tamil", "telugu": "Telugu", "tel": "Telugu",
+    "malayalam": "Malayalam", "mal": "Malayalam", "kannada": "Kannada", "kan": "Kannada",
+    "bengali": "Bengali", "marathi": "Marathi", "punjabi": "Punjabi", "urdu": "Urdu",
+    "korean": "Korean", "japanese": "Japanese", "chinese": "Chinese", "french": "French",
+    "spanish": "Spanish", "german": "German", "italian": "Italian", "russian": "Russian",
+    "dual audio": "Dual Audio", "multi audio": "Multi Audio",
+}
+
+
+def _alternation(words) -> str:
+    # Longest first so "web dl" wins over "web"
+    return "|".join(re.escape(w).replace(r"\ ", " ") for w in sorted(words, key=len, reverse=True))
+
+
+# One alternation of named groups, so a single finditer pass extracts every field
+_PATTERN = re.compile(
+    r"(?<![a-z0-9])(?:"
+    r"s(?P<season>\d{1,2}) ?e(?P<episode>\d{1,3})"
+    r"|(?P<xseason>\d{1,2})x(?P<xepisode>\d{2,3})"
+    r"|season ?(?P<lseason>\d{1,2})"
+    r"|s(?P<sseason>\d{1,2})"
+    r"|(?:e|ep|episode) ?(?P<lepisode>\d{1,3})"
+    r"|(?P<quality>\d{3,4}p|4k|uhd)"
+    rf"|(?P<source>{_alternation(_SOURCES)})"
+    rf"|(?P<codec>{_alternation(_CODECS)})"
+    rf"|(?P<language>{_alternation(_LANGUAGES)})"
+    r"|(?P<year>19[3-9]\d|20[0-4]\d)"
+    r")(?![a-z0-9])"
+)
+
+_SEPARATORS = re.compile(r"[\s._\-+\[\](){}]+")
+
+
+def parse_filename(file_name: str, file_size: Optional[int] = None) -> Dict:
+    """Extract release metadata from a file name in one pass
+
+    Returns quality (``"Unknown"`` if absent), source, codec, year, season,
+    episode, the list of languages and the file size.
+    """
+    text = _SEPARATORS.sub(" ", file_name.lower())
+    meta = {
+        "quality": "Unknown",
+        "source": None,
+        "codec": None,
+        "year": None,
+        "season": None,
+        "episode": None,
+        "languages": [],
+        "file_size": file_size or 0,
+    }
+    for match in _PATTERN.finditer(text):
+        groups = match.groupdict()
+        season = groups["season"] or groups["xseason"] or groups["lseason"] or groups["sseason"]
+        episode = groups["episode"] or groups["xepisode"] or groups["lepisode"]
+        if season or episode:
+            meta["season"] = meta["season"] or (int(season) if season else None)
+            meta["episode"] = meta["episode"] or (int(episode) if episode else None)
+        elif groups["quality"]:
+            value = groups["quality"]
+            value = "2160p" if value in ("4k", "uhd") else value
+            if meta["quality"] == "Unknown" and value in QUALITIES:
+                meta["quality"] = value
+        elif groups["source"]:
+            meta["source"] = meta["source"] or _SOURCES[groups["source"]]
+        elif groups["codec"]:
+            meta["codec"] = meta["codec"] or _CODECS[groups["codec"]]
+        elif groups["language"]:
+            language = _LANGUAGES[groups["language"]]
+            if language not in meta["languages"]:
+                meta["languages"].append(language)
+        elif groups["year"]:
+            # The release year follows the title, so prefer the last one
+            meta["year"] = int(groups["year"])
+    return meta
@@ -0,0 +1,276 @@
+import abc
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pyrogram.errors import FloodWait
+
+# Seconds; tuned for handlers and queries that should finish well under a second
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(abc.ABC):
+    """A registered metric family"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    @abc.abstractmethod
+    def samples(self):
+        """Yield (sample name, formatted labels, value) for every series"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class _LabeledMetric(_Metric):
+    """A metric family recorded in place, with one child per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, **labels):
+        """Return the child for these label values; bind it once on hot paths"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A fresh child holding one series' state"""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_LabeledMetric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            yield self.name, _format_labels(self.labelnames, key), child.value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # One bucket per observation; buckets are made cumulative when rendered
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_LabeledMetric):
+    """Distribution of observed values in fixed buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, f'le="{le}"'), total
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), child.sum
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), child.count
+
+
+class CallbackMetric(_Metric):
+    """Values read from their owner at scrape time, so hot paths pay nothing
+
+    ``callback`` returns a number, or a dict of label value tuples to numbers
+    when the metric has labels.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = (),
+                 type: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self):
+        values = self.callback()
+        if not self.labelnames:
+            values = {(): values}
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_duration_seconds", "Time spent in update handlers", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Update handlers that raised", ("handler",)
+)
+DB_QUERY_SECONDS = Histogram(
+    "bot_db_query_duration_seconds", "Time spent in database helpers", ("helper",)
+)
+TELEGRAM_CALLS = Counter(
+    "bot_telegram_calls_total", "Telegram API calls by method", ("method",)
+)
+TELEGRAM_FLOOD_WAITS = Counter(
+    "bot_telegram_flood_waits_total", "FloodWait errors longer than the client sleeps through", ("method",)
+)
+TELEGRAM_FLOOD_WAIT_SECONDS = Counter(
+    "bot_telegram_flood_wait_seconds_total", "Seconds Telegram asked us to wait"
+)
+AUTO_FILTER_DROPPED = Counter(
+    "bot_auto_filter_dropped_total", "Group messages auto_filter ignored instead of searching or replying", ("reason",)
+)
+LOOP_LAG_SECONDS = Histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop ran a timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels):
+    """Decorate a coroutine function to record its duration"""
+    child = histogram.labels(**labels)
+    error_child = errors.labels(**labels) if errors is not None else None
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if error_child is not None:
+                    error_child.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def handler(name: str):
+    """Record the latency and failures of an update handler"""
+    return timed(HANDLER_SECONDS, HANDLER_ERRORS, handler=name)
+
+
+def instrument_client(client):
+    """Count every Telegram API call and FloodWait made through ``client``"""
+    invoke = client.invoke
+
+    @functools.wraps(invoke)
+    async def counted_invoke(query, *args, **kwargs):
+        method = type(query).__name__
+        TELEGRAM_CALLS.inc(method=method)
+        try:
+            return await invoke(query, *args, **kwargs)
+        except FloodWait as e:
+            TELEGRAM_FLOOD_WAITS.inc(method=method)
+            TELEGRAM_FLOOD_WAIT_SECONDS.inc(e.value)
+            raise
+
+    client.invoke = counted_invoke
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes a periodic timer
+
+    A busy or blocked loop runs the timer late; the delay is what every
+    other coroutine waited too.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start - self.interval)
+            LOOP_LAG_SECONDS.observe(self.lag)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+loop_lag = LoopLagMonitor()
+
+CallbackMetric("bot_event_loop_lag_last_seconds", "Lag of the latest event loop probe", lambda: loop_lag.lag)
@@ -0,0 +1,214 @@
+"""One-off data migrations for existing collections.
+
+Run all pending migrations with ``python migrate.py`` or a single one with
+``python migrate.py <name>``. Migrations work in batches and only touch
+documents that still need them, so an interrupted run can simply be restarted.
+"""
+import argparse
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pyrogram.file_id import FileId, FileUniqueId, FileUniqueType
+
+from database import (
+    col_files, col_migrations, col_settings, col_thumb, col_tokens, col_users, pending_migrations, update_token_stats
+)
+from metadata import METADATA_VERSION, parse_filename
+from schema import ensure_indexes
+from search import tokenize, trigrams
+
+BATCH_SIZE = 1000
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+async def migrate_tokens():
+    """Tokenize file names indexed before the token index existed"""
+    migrated = 0
+    last_id = None
+    while True:
+        query = {"tokens": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await col_files.find(query, {"file_name": 1}).sort("_id", 1).limit(BATCH_SIZE).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        frequency = Counter()
+        for doc in batch:
+            tokens = tokenize(doc.get("file_name", ""))
+            frequency.update(tokens)
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"tokens": tokens}}))
+        await col_files.bulk_write(ops, ordered=False)
+        await update_token_stats(frequency)
+
+        migrated += len(batch)
+        logger.info("tokens: %d files migrated", migrated)
+
+
+async def migrate_metadata():
+    """Parse release metadata of files indexed by an older parser version"""
+    migrated = 0
+    last_id = None
+    while True:
+        query = {"meta_version": {"$ne": METADATA_VERSION}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await col_files.find(
+            query, {"file_name": 1, "file_size": 1}
+        ).sort("_id", 1).limit(BATCH_SIZE).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {
+                **parse_filename(doc.get("file_name", ""), doc.get("file_size")),
+                "meta_version": METADATA_VERSION,
+            }})
+            for doc in batch
+        ]
+        await col_files.bulk_write(ops, ordered=False)
+
+        migrated += len(batch)
+        logger.info("metadata: %d files migrated", migrated)
+
+
+async def migrate_trigrams():
+    """Add trigrams to vocabulary tokens created before the trigram index"""
+    migrated = 0
+    last_id = None
+    while True:
+        query = {"trigrams": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await col_tokens.find(query, {"_id": 1}).sort("_id", 1).limit(BATCH_SIZE).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"trigrams": trigrams(doc["_id"]), "len": len(doc["_id"])}})
+            for doc in batch
+        ]
+        await col_tokens.bulk_write(ops, ordered=False)
+
+        migrated += len(batch)
+        logger.info("trigrams: %d tokens migrated", migrated)
+
+
+async def migrate_profiles():
+    """Merge thumbnails and captions into the one profile document per user"""
+    for collection, fields in ((col_thumb, ("is_lazy", "thumb_id")), (col_settings, ("caption",))):
+        migrated = 0
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            batch = await collection.find(query).sort("_id", 1).limit(BATCH_SIZE).to_list(None)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+
+            ops = []
+            for doc in batch:
+                if "thumb_id" in fields:
+                    update = {"lazy_thumb_id" if doc.get("is_lazy") else "thumb_id": doc.get("thumb_id")}
+                else:
+                    update = {"caption": doc.get("caption")}
+                # Create missing profiles, but never overwrite a value saved through the new helpers
+                ops.append(UpdateOne({"user_id": doc["user_id"]}, {"$setOnInsert": update}, upsert=True))
+                ops.append(UpdateOne(
+                    {"user_id": doc["user_id"], **{field: {"$exists": False} for field in update}},
+                    {"$set": update},
+                ))
+            # Ordered, so each profile exists before its conditional update
+            await col_users.bulk_write(ops, ordered=True)
+
+            migrated += len(batch)
+            logger.info("profiles: %d %s documents merged", migrated, collection.name)
+
+
+def unique_id_of(file_id: str) -> str:
+    """Rebuild the file_unique_id Telegram would report for a stored file_id"""
+    # Pyrogram derives the unique id of documents, videos, audio and photos alike from the media id
+    decoded = FileId.decode(file_id)
+    return FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=decoded.media_id).encode()
+
+
+async def migrate_file_unique_ids():
+    """Store file_unique_id on files indexed before it was saved, so compaction can find their copies
+
+    The size of those files was never stored and stays 0.
+    """
+    migrated = skipped = 0
+    last_id = None
+    while True:
+        query = {"file_unique_id": {"$in": [None, ""]}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await col_files.find(query, {"file_id": 1}).sort("_id", 1).limit(BATCH_SIZE).to_list(None)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        for doc in batch:
+            try:
+                file_unique_id = unique_id_of(doc["file_id"])
+            except Exception as e:
+                skipped += 1
+                logger.warning("file_unique_ids: cannot decode file_id of %s: %s", doc["_id"], e)
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"file_unique_id": file_unique_id}}))
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], "file_size": {"$exists": False}}, {"$set": {"file_size": 0}}
+            ))
+        if ops:
+            await col_files.bulk_write(ops, ordered=False)
+
+        migrated += len(batch)
+        logger.info("file_unique_ids: %d files migrated, %d skipped", migrated, skipped)
+
+
+MIGRATIONS = {
+    "tokens": migrate_tokens,
+    f"metadata_v{METADATA_VERSION}": migrate_metadata,
+    "trigrams": migrate_trigrams,
+    "profiles": migrate_profiles,
+    "file_unique_ids": migrate_file_unique_ids,
+}
+
+
+async def run(names):
+    await ensure_indexes()
+    for name in names:
+        logger.info("Running migration %s", name)
+        await MIGRATIONS[name]()
+        await col_migrations.update_one(
+            {"_id": name},
+            {"$set": {"done_at": datetime.now()}},
+            upsert=True
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"migrations to run: {', '.join(MIGRATIONS)} (default: all pending)")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in MIGRATIONS]
+    if unknown:
+        parser.error(f"unknown migration: {', '.join(unknown)}")
+    await run(args.names or await pending_migrations(MIGRATIONS))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
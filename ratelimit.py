@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Hashable, Optional
+
+from cache import TTLCache
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second
+
+    ``acquire`` waits until a token is available, so callers sharing one
+    bucket are collectively held to its rate while bursts of up to
+    ``capacity`` are allowed after idle periods.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float):
+        """Change the refill rate, keeping the tokens accumulated so far"""
+        self._refill()
+        self.rate = rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if available without waiting"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until tokens are available and take them"""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class KeyedRateLimiter:
+    """A token bucket per key, such as a user or chat id, checked without waiting
+
+    A bucket idle long enough to refill completely is no different from a
+    new one, so it is dropped after that long and memory stays bounded by
+    the keys active recently, up to ``max_keys``. A ``rate`` of 0 disables
+    the limit.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 100000):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._buckets = TTLCache(max_entries=max_keys, ttl=self.capacity / rate if rate > 0 else 0)
+        self.allowed = 0
+        self.limited = 0
+
+    def allow(self, key: Hashable) -> bool:
+        """Take a token for ``key`` if it has one"""
+        if self.rate <= 0:
+            return True
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+        # Re-set on every use so only idle buckets expire
+        self._buckets.set(key, bucket)
+        if bucket.try_acquire():
+            self.allowed += 1
+            return True
+        self.limited += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
@@ -0,0 +1,170 @@
+"""Index declarations and query-plan checks for every collection.
+
+``ensure_indexes`` runs at startup. ``explain_queries`` runs ``explain()`` on
+the query shape of every database helper and reports the ones that fall back
+to a collection scan; it runs at startup when ``DB_EXPLAIN`` is set, and
+``python schema.py`` exits non-zero when any COLLSCAN is found so it can
+guard against regressions in CI.
+"""
+import asyncio
+import logging
+import sys
+from typing import List
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from database import (
+    col_files,
+    col_filters,
+    col_users,
+    col_thumb,
+    col_settings,
+    col_tokens,
+    col_migrations,
+    col_index_jobs,
+    col_broadcasts,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_NOT_FOUND = 27
+
+INDEXES = [
+    (col_files, [
+        IndexModel([("tokens", ASCENDING), ("quality", ASCENDING)], name="tokens_quality"),
+        IndexModel([("file_unique_id", ASCENDING), ("file_size", ASCENDING)], name="file_unique_id_size"),
+        # Keeps concurrent upserts of one file from both inserting. Files without an id, and older
+        # files without a size (which may still have copies until /compact runs), are left out.
+        IndexModel(
+            [("file_unique_id", ASCENDING), ("file_size", ASCENDING)], name="file_unique_id_size_unique",
+            unique=True,
+            partialFilterExpression={"file_unique_id": {"$type": "string", "$gt": ""}, "file_size": {"$gt": 0}},
+        ),
+    ]),
+    (col_tokens, [
+        IndexModel([("trigrams", ASCENDING), ("len", ASCENDING)], name="trigrams_len"),
+    ]),
+    (col_filters, [
+        IndexModel([("chat_id", ASCENDING), ("keyword", ASCENDING)], name="chat_keyword", unique=True),
+    ]),
+    (col_users, [
+        IndexModel([("user_id", ASCENDING)], name="user_id", unique=True),
+        IndexModel([("blocked", ASCENDING), ("user_id", ASCENDING)], name="blocked_user_id"),
+    ]),
+    (col_thumb, [
+        IndexModel([("user_id", ASCENDING), ("is_lazy", ASCENDING)], name="user_lazy", unique=True),
+    ]),
+    (col_settings, [
+        IndexModel([("user_id", ASCENDING)], name="user_id", unique=True),
+    ]),
+    (col_index_jobs, [
+        IndexModel([("status", ASCENDING)], name="status"),
+    ]),
+    (col_broadcasts, [
+        IndexModel([("status", ASCENDING)], name="status"),
+    ]),
+]
+
+# Indexes of earlier versions superseded by the ones above, dropped once those exist
+OBSOLETE_INDEXES = [
+    (col_files, ["tokens", "file_unique_id"]),
+]
+
+# (helper, collection, filter, sort) for every query the bot issues
+QUERY_SHAPES = [
+    ("search_files", col_files, {"tokens": {"$all": ["avengers", "2019"]}}, None),
+    ("search_files (quality)", col_files, {"tokens": {"$all": ["avengers"]}, "quality": "1080p"}, None),
+    ("search_files (prefix)", col_files, {"tokens": {"$regex": "^aven"}}, None),
+    ("get_files_by_ids", col_files, {"_id": {"$in": [ObjectId()]}}, None),
+    ("save_file", col_files, {"file_unique_id": "AgADxxxx", "file_size": {"$in": [1048576, 0]}}, None),
+    ("compact_files", col_files, {"file_unique_id": {"$gte": "AgADxxxx"}}, [("file_unique_id", ASCENDING), ("file_size", ASCENDING)]),
+    ("plan_search", col_tokens, {"_id": {"$in": ["avengers"]}}, None),
+    ("correct_query (prefix)", col_tokens, {"_id": {"$regex": "^aven"}}, None),
+    ("suggest_token", col_tokens, {"trigrams": {"$in": ["^av", "avn"]}, "len": {"$gte": 5, "$lte": 9}}, None),
+    ("delete_filter", col_filters, {"chat_id": -100, "keyword": "avengers"}, None),
+    ("get_all_filters", col_filters, {"chat_id": -100}, None),
+    ("add_user", col_users, {"user_id": 1}, None),
+    ("get_reachable_users", col_users, {"blocked": {"$ne": True}, "user_id": {"$gt": 1}}, [("user_id", ASCENDING)]),
+    ("count_reachable_users", col_users, {"blocked": {"$ne": True}}, None),
+    ("mark_users_blocked", col_users, {"user_id": {"$in": [1, 2]}}, None),
+    ("get_profile", col_users, {"user_id": 1}, None),
+    ("get_legacy_profile (thumbnails)", col_thumb, {"user_id": 1}, None),
+    ("get_legacy_profile (caption)", col_settings, {"user_id": 1}, None),
+    ("pending_migrations", col_migrations, {"_id": {"$in": ["tokens"]}}, None),
+    ("get_index_job", col_index_jobs, {"_id": -100}, None),
+    ("get_unfinished_index_jobs", col_index_jobs, {"status": "running"}, None),
+    ("get_unfinished_broadcasts", col_broadcasts, {"status": "running"}, None),
+]
+
+
+async def ensure_indexes():
+    """Create every declared index, then drop the obsolete ones they replace
+
+    Existing indexes are left untouched. An obsolete index is kept while
+    its replacement can't be built, so queries stay index-backed.
+    """
+    failed = set()
+    for collection, indexes in INDEXES:
+        for index in indexes:
+            # One at a time, so an index that can't be built doesn't hold up the others
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                # Usually duplicate data blocking a unique index; the bot still works without it
+                logger.error("Could not create index %s on %s: %s", index.document["name"], collection.name, e)
+                failed.add(collection.name)
+    for collection, names in OBSOLETE_INDEXES:
+        if collection.name in failed:
+            continue
+        for name in names:
+            try:
+                await collection.drop_index(name)
+                logger.info("Dropped obsolete index %s on %s", name, collection.name)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    logger.warning("Could not drop index %s on %s: %s", name, collection.name, e)
+
+
+def _stages(plan: dict) -> List[str]:
+    """Flatten the stage names of a query plan tree"""
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+    return stages
+
+
+async def explain_queries() -> List[str]:
+    """Explain every query shape and return the helpers that scan a whole collection"""
+    scans = []
+    for helper, collection, query, sort in QUERY_SHAPES:
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+        stages = _stages(plan)
+        if "COLLSCAN" in stages:
+            scans.append(helper)
+            logger.warning("COLLSCAN: %s on %s %s", helper, collection.name, query)
+        else:
+            logger.debug("%s: %s", helper, " <- ".join(stages))
+    return scans
+
+
+async def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    await ensure_indexes()
+    scans = await explain_queries()
+    if scans:
+        logger.error("%d query shape(s) are not index-backed: %s", len(scans), ", ".join(scans))
+        return 1
+    logger.info("All %d query shapes are index-backed", len(QUERY_SHAPES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
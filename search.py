@@ -0,0 +1,66 @@
+import re
+import unicodedata
+from typing import List, Optional
+
+# Separators commonly used in release file names
+SEPARATORS = re.compile(r"[\s._\-+,;:|/\\\[\](){}'\"!?#&~=*]+")
+
+# Tokens that carry no search value and would only bloat the posting lists
+RELEASE_TAGS = {
+    "mkv", "mp4", "avi", "m4v", "webm", "mov", "wmv", "flv", "ts",
+    "mp3", "flac", "m4a", "aac", "ogg", "zip", "rar", "7z",
+    "www", "com", "org", "net",
+    "the", "a", "an", "and", "of",
+}
+
+# Links are never search queries; file names with "www.site.com" tags are
+LINK = re.compile(r"https?://|\bt\.me/|\btelegram\.(?:me|dog)/", re.IGNORECASE)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents so "Amélie" and "amelie" compare equal"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a file name or query into unique search tokens, in order"""
+    tokens = []
+    seen = set()
+    for token in SEPARATORS.split(normalize(text)):
+        if not token or token in RELEASE_TAGS or token.startswith("@") or token in seen:
+            continue
+        seen.add(token)
+        tokens.append(token)
+    return tokens
+
+
+def trigrams(token: str) -> List[str]:
+    """Character trigrams of a token, padded so its start and end count too"""
+    padded = f"^{token}$"
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of two tokens' trigram sets"""
+    ga, gb = set(trigrams(a)), set(trigrams(b))
+    return len(ga & gb) / len(ga | gb) if ga or gb else 0.0
+
+
+def skip_reason(text: str, min_length: int = 3, max_length: int = 100) -> Optional[str]:
+    """Why a message is obviously not a search query, or None if it may be one
+
+    Emoji, stickers-as-text, links, one or two characters and paragraphs of
+    chatter are dropped before any database access.
+    """
+    if LINK.search(text):
+        return "link"
+    letters = sum(1 for ch in text if ch.isalnum())
+    if not letters:
+        return "no_words"
+    if letters < min_length:
+        return "too_short"
+    if len(text) > max_length:
+        return "too_long"
+    return None
@@ -0,0 +1,35 @@
+import secrets
+from typing import Dict, List, Optional
+
+from cache import TTLCache
+
+
+class ResultSessions:
+    """Compact per-search state for result keyboards
+
+    A session keeps only the query, the ordered ObjectIds of its results and
+    the per-quality counts, so callbacks can carry a short session id instead
+    of the raw query and every page is a range read by ``_id``.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 1800):
+        self._sessions = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def create(self, query: str, results: List[dict], qualities: Dict[str, int]) -> str:
+        """Store a search result and return its session id"""
+        session_id = secrets.token_urlsafe(6)
+        while session_id in self._sessions:
+            session_id = secrets.token_urlsafe(6)
+        self._sessions.set(session_id, {
+            "query": query,
+            "ids": [file["_id"] for file in results],
+            "qualities": qualities,
+        })
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        """Return a live session, or None once it has expired"""
+        return self._sessions.get(session_id)
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
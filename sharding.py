@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+WORKER_PREFIX = "worker:"
+SHARD_PREFIX = "shard:"
+
+
+def shard_of(chat_id: int, shard_count: int) -> int:
+    """The shard that owns a chat; stable for a given shard count"""
+    return chat_id % shard_count
+
+
+class LocalLeaseStore:
+    """In-process stand-in for the lease collection
+
+    Used when a single worker runs, and by the benchmarks. Every coordinator
+    sharing one instance sees the same leases.
+    """
+
+    def __init__(self):
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        holder = self._leases.get(name)
+        now = time.monotonic()
+        if holder and holder[0] != owner and holder[1] > now:
+            return False
+        self._leases[name] = (owner, now + ttl)
+        return True
+
+    async def release(self, name: str, owner: str):
+        holder = self._leases.get(name)
+        if holder and holder[0] == owner:
+            del self._leases[name]
+
+    async def count_live(self, prefix: str) -> int:
+        return len(await self.live_owners(prefix))
+
+    async def live_owners(self, prefix: str) -> Dict[str, str]:
+        now = time.monotonic()
+        return {
+            name: owner for name, (owner, expires) in self._leases.items() if name.startswith(prefix) and expires > now
+        }
+
+
+class MongoLeaseStore:
+    """Leases kept in a MongoDB collection, shared by every worker
+
+    A lease is one document keyed by name. Acquiring is a single upsert that
+    only matches when the lease is free, expired or already ours; when
+    another worker holds it the upsert hits the unique ``_id`` and fails.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.update_one(
+                {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self, name: str, owner: str):
+        await self.collection.delete_one({"_id": name, "owner": owner})
+
+    async def count_live(self, prefix: str) -> int:
+        return await self.collection.count_documents({
+            "_id": {"$regex": "^" + prefix},
+            "expires_at": {"$gt": datetime.now(timezone.utc)}
+        })
+
+    async def live_owners(self, prefix: str) -> Dict[str, str]:
+        cursor = self.collection.find(
+            {"_id": {"$regex": "^" + prefix}, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"owner": 1}
+        )
+        return {doc["_id"]: doc["owner"] async for doc in cursor}
+
+
+class ShardCoordinator:
+    """Split chats across workers with renewable leases
+
+    Chats are split into ``shard_count`` shards by id. Every worker heartbeats a
+    worker lease and holds the shard leases of its fair share, ceil(shards /
+    live workers): it releases shards above that share so new workers can
+    take them and claims free or expired ones below it. One worker also
+    holds the leader lease and runs the jobs that must not run twice, such
+    as channel indexing and broadcasts.
+
+    Telegram does not redeliver updates, so no shard may go unhandled while
+    it changes hands. A worker keeps handling the shards it released until
+    the store shows another worker holding them, and the leader handles
+    every shard nobody holds, such as those of a worker that stopped, until
+    one is claimed. A worker that cannot renew a lease treats it as lost
+    right away, before it can expire and be taken by another worker.
+    """
+
+    def __init__(self, store, worker_id: str, shard_count: int = 1, ttl: float = 30, renew_interval: float = 10,
+                 on_lost: Optional[Callable[[Set[int]], None]] = None):
+        self.store = store
+        self.worker_id = worker_id
+        self.shard_count = shard_count
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.on_lost = on_lost
+        self.shards: Set[int] = set()
+        # Released by this worker, not yet held by another one
+        self.handoff: Set[int] = set()
+        # Held by nobody; handled by the leader
+        self.orphans: Set[int] = set()
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    def handled(self) -> Set[int]:
+        """Shards whose updates this worker handles right now"""
+        return self.shards | self.handoff | self.orphans
+
+    def owns(self, chat_id: int) -> bool:
+        shard = shard_of(chat_id, self.shard_count)
+        return shard in self.shards or shard in self.handoff or shard in self.orphans
+
+    async def _acquire(self, name: str) -> bool:
+        try:
+            return await self.store.acquire(name, self.worker_id, self.ttl)
+        except Exception as e:
+            logger.warning("Lease %s not renewed: %s", name, e)
+            return False
+
+    async def rebalance(self):
+        """Renew our leases, then move towards our fair share of shards"""
+        handled = self.handled()
+        if not await self._acquire(WORKER_PREFIX + self.worker_id):
+            # Without a heartbeat, other workers may already be taking our shards
+            self.shards, self.handoff, self.orphans = set(), set(), set()
+            self.is_leader = False
+            if handled and self.on_lost:
+                self.on_lost(handled)
+            return
+        released = set()
+
+        for shard in sorted(self.shards):
+            if not await self._acquire(f"{SHARD_PREFIX}{shard}"):
+                self.shards.discard(shard)
+
+        workers = max(1, await self.store.count_live(WORKER_PREFIX))
+        share = math.ceil(self.shard_count / workers)
+        for shard in sorted(self.shards, reverse=True)[:max(0, len(self.shards) - share)]:
+            await self.store.release(f"{SHARD_PREFIX}{shard}", self.worker_id)
+            self.shards.discard(shard)
+            released.add(shard)
+        for shard in range(self.shard_count):
+            if len(self.shards) >= share:
+                break
+            if shard not in self.shards and await self._acquire(f"{SHARD_PREFIX}{shard}"):
+                self.shards.add(shard)
+
+        self.is_leader = await self._acquire(LEADER_LEASE)
+        await self._cover_unheld(released)
+        lost = handled - self.handled()
+        if lost and self.on_lost:
+            self.on_lost(lost)
+
+    async def _cover_unheld(self, released: Set[int]):
+        """Keep handling released shards, and as leader unheld ones, until another worker holds them"""
+        try:
+            owners = await self.store.live_owners(SHARD_PREFIX)
+        except Exception as e:
+            # Keep covering what we covered; dropping updates is worse than handling one twice
+            logger.warning("Could not read shard leases: %s", e)
+            self.handoff = (self.handoff | released) - self.shards
+            return
+        held = {int(name[len(SHARD_PREFIX):]) for name in owners}
+        self.handoff = (self.handoff | released) - held - self.shards
+        if self.is_leader:
+            self.orphans = set(range(self.shard_count)) - held - self.shards - self.handoff
+        else:
+            self.orphans = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.warning("Shard rebalance failed: %s", e)
+            await asyncio.sleep(self.renew_interval)
+
+    async def close(self):
+        """Stop renewing and hand every lease back"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        names = [f"{SHARD_PREFIX}{shard}" for shard in self.shards] + [WORKER_PREFIX + self.worker_id]
+        if self.is_leader:
+            names.append(LEADER_LEASE)
+        for name in names:
+            try:
+                await self.store.release(name, self.worker_id)
+            except Exception as e:
+                logger.warning("Could not release lease %s: %s", name, e)
+        self.shards, self.handoff, self.orphans = set(), set(), set()
+        self.is_leader = False
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "shards": sorted(self.shards),
+            "covering": sorted(self.handoff | self.orphans),
+            "shard_count": self.shard_count,
+            "leader": self.is_leader,
+        }